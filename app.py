@@ -1,10 +1,13 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify
 from flask_cors import CORS
 import os
 import logging
+import threading
 from datetime import datetime
 from dotenv import load_dotenv
 from controllers.download_controller import DownloadController
+from models.maintenance import MaintenanceRunner
+from models.metrics import metrics
 
 # Load environment variables
 load_dotenv()
@@ -17,11 +20,9 @@ CORS(app, origins="*", supports_credentials=True)
 
 # Configuration
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
-app.config['DOWNLOAD_FOLDER'] = os.path.join(os.getcwd(), 'static', 'downloads')
 app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_FILE_SIZE_MB', 100)) * 1024 * 1024
 
 # Ensure required folders exist
-os.makedirs(app.config['DOWNLOAD_FOLDER'], exist_ok=True)
 os.makedirs('logs', exist_ok=True)
 
 # Set up logging
@@ -34,36 +35,51 @@ logging.basicConfig(
     ]
 )
 
-# Initialize controller
-try:
-    download_controller = DownloadController()
-    app.logger.info("Download controller initialized successfully")
-except Exception as e:
-    app.logger.error(f"Failed to initialize download controller: {e}")
-    download_controller = None
-
-# Background cleanup setup
-import threading
-import time
-
-def cleanup_worker():
-    """Background worker to clean up old files"""
-    while True:
-        try:
-            # Run cleanup every 6 hours
-            cleaned = download_controller.cleanup_old_files(max_age_hours=24)
-            if cleaned > 0:
-                app.logger.info(f"Cleaned up {cleaned} old files")
-        except Exception as e:
-            app.logger.error(f"Error in cleanup worker: {e}")
-        
-        # Sleep for 6 hours
-        time.sleep(6 * 3600)
-
-# Start background cleanup worker
-cleanup_thread = threading.Thread(target=cleanup_worker, daemon=True)
-cleanup_thread.start()
-app.logger.info("Background cleanup worker started")
+# The controller (database, pools, job scheduler) is built on first use
+# in each process, so importing the app, e.g. in the gunicorn master with
+# preload_app, starts no threads and opens no connections before the fork
+_controller = None
+_controller_lock = threading.Lock()
+maintenance = None
+
+def get_controller():
+    """This process's download controller, or None if it failed to start"""
+    global _controller, maintenance
+    if _controller is not None:
+        return _controller
+    with _controller_lock:
+        if _controller is None:
+            try:
+                controller = DownloadController()
+            except Exception as e:
+                # Retried on the next request
+                app.logger.error(f"Failed to initialize download controller: {e}")
+                return None
+            app.logger.info("Download controller initialized successfully")
+            # Jobs left by a worker that died are picked up by the next one
+            # to start, or by the maintenance process
+            try:
+                resumed = controller.resume_jobs()
+                if resumed:
+                    app.logger.info(f"Resumed {resumed} interrupted jobs")
+            except Exception as e:
+                app.logger.error(f"Error resuming interrupted jobs: {e}")
+            maintenance = MaintenanceRunner(
+                [
+                    ('cleanup', lambda: cleanup_tick(controller)),
+                    ('jobs', controller.resume_jobs),
+                    ('metrics', metrics.compact),
+                ],
+                on_elected=controller.migrate_legacy_meta,
+            ).start()
+            _controller = controller
+    return _controller
+
+def cleanup_tick(controller):
+    """Remove old files in a small slice"""
+    cleaned = controller.cleanup.tick()
+    if cleaned > 0:
+        app.logger.info(f"Cleaned up {cleaned} old files")
 
 @app.route('/')
 def index():
@@ -74,23 +90,50 @@ def index():
 def download():
     """Handle download requests"""
     app.logger.info(f"Download request from {request.remote_addr}")
-    return download_controller.download(request)
+    return get_controller().download(request)
+
+@app.route('/api/batch', methods=['POST'])
+def batch_download():
+    """Start a batch or playlist download"""
+    app.logger.info(f"Batch request from {request.remote_addr}")
+    return get_controller().batch(request)
+
+@app.route('/api/batch/<batch_id>')
+def get_batch(batch_id):
+    """Get batch progress"""
+    return get_controller().get_batch(batch_id)
+
+@app.route('/api/batch/<batch_id>/zip')
+def batch_zip(batch_id):
+    """Download a finished batch as a ZIP archive"""
+    return get_controller().batch_zip(batch_id)
 
 @app.route('/api/progress/<task_id>')
 def get_progress(task_id):
     """Get download progress"""
-    return download_controller.get_progress(task_id)
+    return get_controller().get_progress(task_id)
+
+@app.route('/api/progress/<task_id>/stream')
+def stream_progress(task_id):
+    """Push download progress as Server-Sent Events"""
+    return get_controller().stream_progress(task_id)
 
 @app.route('/api/file/<filename>')
 def download_file(filename):
     """Serve downloaded files"""
     app.logger.info(f"File download request for {filename} from {request.remote_addr}")
-    return download_controller.serve_file(filename, app.config['DOWNLOAD_FOLDER'])
+    return get_controller().serve_file(filename)
+
+@app.route('/api/stream')
+def stream_mp3():
+    """Stream an MP3 while it is being encoded"""
+    app.logger.info(f"Stream request from {request.remote_addr}")
+    return get_controller().stream_mp3(request)
 
 @app.route('/api/info', methods=['POST'])
 def get_video_info():
     """Get video information"""
-    return download_controller.get_video_info(request)
+    return get_controller().get_video_info(request)
 
 @app.route('/api/test', methods=['GET'])
 def test_yt_dlp():
@@ -153,19 +196,30 @@ def test_yt_dlp():
 @app.route('/api/stats')
 def get_stats():
     """Get download statistics"""
-    stats = download_controller.get_stats()
+    stats = get_controller().get_stats()
     return jsonify(stats)
 
+@app.route('/api/stats/files')
+def list_files():
+    """Page through stored files"""
+    return get_controller().list_files(request)
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus metrics for the download pipeline"""
+    return get_controller().get_metrics()
+
 @app.route('/api/health')
 def health_check():
     """Health check endpoint"""
     try:
-        status = 'healthy' if download_controller else 'unhealthy'
+        controller = get_controller()
+        status = 'healthy' if controller else 'unhealthy'
         return jsonify({
             'status': status,
             'timestamp': datetime.utcnow().isoformat(),
             'version': '1.0.0',
-            'controller_ready': download_controller is not None
+            'controller_ready': controller is not None
         })
     except Exception as e:
         return jsonify({
@@ -0,0 +1,10 @@
+"""
+gunicorn entry point for benchmarks: the real app with the fake extractor
+
+    BENCH_FIXTURE_URL=http://127.0.0.1:8001 gunicorn benchmarks.fake_app:app
+"""
+from benchmarks.fake_youtube import install_from_env
+
+install_from_env()
+
+from app import app  # noqa: E402
@@ -0,0 +1,151 @@
+"""
+Offline stand-ins for YouTube: a fixture media server and a YoutubeDL
+subclass that answers every URL with an info dict pointing at it.
+
+Only extraction is faked. Format selection, the HTTP download, progress
+hooks and postprocessors are the real yt-dlp code paths, so the numbers
+include everything the app does except talking to YouTube.
+"""
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import yt_dlp
+
+from models.downloader import extract_video_id
+
+RANGE_PATTERN = re.compile(r'bytes=(\d*)-(\d*)')
+
+
+def fixture_payload(size):
+    """Deterministic bytes so every run downloads exactly the same data"""
+    block = bytes(range(256)) * 4096
+    return (block * (size // len(block) + 1))[:size]
+
+
+class FixtureServer:
+    """Serves /media/<anything> from memory with Range support"""
+
+    def __init__(self, size=512 * 1024, host='127.0.0.1', port=0):
+        payload = fixture_payload(size)
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                start, end = 0, len(payload) - 1
+                match = RANGE_PATTERN.fullmatch(self.headers.get('Range', ''))
+                if match and (match.group(1) or match.group(2)):
+                    if match.group(1):
+                        start = int(match.group(1))
+                        if match.group(2):
+                            end = min(int(match.group(2)), end)
+                    else:
+                        start = max(len(payload) - int(match.group(2)), 0)
+                    if start >= len(payload):
+                        self.send_response(416)
+                        self.send_header('Content-Range', f'bytes */{len(payload)}')
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{len(payload)}')
+                else:
+                    self.send_response(200)
+                body = payload[start:end + 1]
+                self.send_header('Content-Type', 'video/mp4')
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.size = size
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def fixture_info(video_id, base_url, size):
+    """Info dict shaped like a YouTube extraction, media on the fixture server"""
+    return {
+        'id': video_id,
+        'title': f'Fixture {video_id}',
+        'duration': 60,
+        'thumbnail': f'{base_url}/thumb/{video_id}.jpg',
+        'uploader': 'Benchmark',
+        'view_count': 0,
+        'webpage_url': f'https://www.youtube.com/watch?v={video_id}',
+        'extractor': 'youtube',
+        'extractor_key': 'Youtube',
+        'formats': [
+            {
+                'format_id': '140', 'ext': 'm4a', 'protocol': 'http',
+                'url': f'{base_url}/media/{video_id}.m4a',
+                'acodec': 'mp4a.40.2', 'vcodec': 'none', 'abr': 128,
+                'filesize': size,
+            },
+            {
+                'format_id': '18', 'ext': 'mp4', 'protocol': 'http',
+                'url': f'{base_url}/media/{video_id}.mp4',
+                'acodec': 'mp4a.40.2', 'vcodec': 'avc1.42001E', 'height': 360,
+                'width': 640, 'tbr': 500, 'filesize': size,
+            },
+        ],
+    }
+
+
+class FakeYoutubeDL(yt_dlp.YoutubeDL):
+    """YoutubeDL whose extraction step returns fixture info dicts"""
+
+    base_url = None
+    media_size = 512 * 1024
+    extract_latency = 0.0
+
+    def extract_info(self, url, download=True, ie_key=None, extra_info=None,
+                     process=True, force_generic_extractor=False):
+        if self.extract_latency:
+            time.sleep(self.extract_latency)
+        info = fixture_info(extract_video_id(url), self.base_url, self.media_size)
+        if not process:
+            return info
+        return self.process_ie_result(info, download=download)
+
+    def download(self, url_list):
+        for url in url_list:
+            self.extract_info(url)
+        return self._download_retcode
+
+
+def install(base_url, media_size=512 * 1024, extract_latency=0.0):
+    """Make every yt_dlp.YoutubeDL in this process the fake one"""
+    FakeYoutubeDL.base_url = base_url
+    FakeYoutubeDL.media_size = media_size
+    FakeYoutubeDL.extract_latency = extract_latency
+    yt_dlp.YoutubeDL = FakeYoutubeDL
+
+
+def install_from_env():
+    """install() configured by BENCH_* env vars, for the gunicorn entry point"""
+    install(
+        os.environ['BENCH_FIXTURE_URL'],
+        int(os.getenv('BENCH_MEDIA_SIZE', 512 * 1024)),
+        float(os.getenv('BENCH_EXTRACT_LATENCY', 0)),
+    )
@@ -0,0 +1,375 @@
+"""
+Offline benchmark of the request paths and end-to-end job throughput
+
+    python -m benchmarks.run                      # Flask test client
+    python -m benchmarks.run --mode gunicorn      # real gunicorn workers
+    python -m benchmarks.run --mode gunicorn --worker-class gevent
+    python -m benchmarks.run --baseline old.json  # fail on regressions
+
+Runs against a temporary working directory (downloads, state database),
+a local fixture media server and a fake extractor, so results only
+depend on this code and this machine. Results are written as JSON.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fake_youtube import FixtureServer, install  # noqa: E402
+
+
+def video_url(n):
+    return f'https://www.youtube.com/watch?v=bench{n:06d}'
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class TestClientBackend:
+    """Drives the app in this process through Flask's test client"""
+
+    name = 'client'
+
+    def __init__(self, workdir, fixture, args):
+        os.chdir(workdir)
+        install(fixture.url, args.media_kb * 1024, args.extract_latency)
+        import app as app_module
+        self.app = app_module.app
+        self._local = threading.local()
+
+    def request(self, method, path, body=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body)
+        data = response.get_data()
+        response.close()
+        return response.status_code, data
+
+    def close(self):
+        pass
+
+
+class GunicornBackend:
+    """Drives a real gunicorn server over HTTP"""
+
+    name = 'gunicorn'
+
+    def __init__(self, workdir, fixture, args):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        self.base_url = f'http://127.0.0.1:{port}'
+
+        env = dict(
+            os.environ,
+            PYTHONPATH=REPO_ROOT,
+            BENCH_FIXTURE_URL=fixture.url,
+            BENCH_MEDIA_SIZE=str(args.media_kb * 1024),
+            BENCH_EXTRACT_LATENCY=str(args.extract_latency),
+        )
+        command = [
+            sys.executable, '-m', 'gunicorn',
+            '--bind', f'127.0.0.1:{port}',
+            '--workers', str(args.workers),
+            '--worker-class', args.worker_class, '--threads', str(args.threads),
+            '--worker-connections', str(args.worker_connections),
+            '--timeout', '300', '--log-level', 'warning',
+            'benchmarks.fake_app:app',
+        ]
+        self.process = subprocess.Popen(
+            command, cwd=workdir, env=env,
+            stdout=subprocess.DEVNULL, stderr=open(os.path.join(workdir, 'gunicorn.log'), 'w')
+        )
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            try:
+                if self.request('GET', '/api/health')[0] == 200:
+                    return
+            except OSError:
+                pass
+            if self.process.poll() is not None:
+                break
+            time.sleep(0.2)
+        self.close()
+        raise RuntimeError(f'gunicorn did not start, see {workdir}/gunicorn.log')
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        if data is not None:
+            req.add_header('Content-Type', 'application/json')
+        try:
+            with urllib.request.urlopen(req, timeout=120) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def close(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def run_load(backend, calls, concurrency):
+    """Issue (method, path, body) calls from concurrency threads
+
+    Returns latency stats plus the decoded JSON bodies in call order.
+    """
+    latencies = [None] * len(calls)
+    bodies = [None] * len(calls)
+    errors = [0]
+    lock = threading.Lock()
+
+    def issue(i):
+        method, path, body = calls[i]
+        started = time.perf_counter()
+        try:
+            status, data = backend.request(method, path, body)
+        except Exception:
+            status, data = None, b''
+        latencies[i] = time.perf_counter() - started
+        if status is None or status >= 400:
+            with lock:
+                errors[0] += 1
+        try:
+            bodies[i] = json.loads(data) if data[:1] in (b'{', b'[') else None
+        except ValueError:
+            bodies[i] = None
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(issue, range(len(calls))))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'requests': len(calls),
+        'errors': errors[0],
+        'seconds': round(elapsed, 4),
+        'requests_per_second': round(len(calls) / elapsed, 2) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3) if calls else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if calls else None,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if calls else None,
+    }, bodies
+
+
+def wait_for_tasks(backend, task_ids, timeout):
+    """Poll progress until every task finished or failed"""
+    pending = set(task_ids)
+    results = {}
+    deadline = time.monotonic() + timeout
+    while pending and time.monotonic() < deadline:
+        for task_id in list(pending):
+            status, data = backend.request('GET', f'/api/progress/{task_id}')
+            progress = (json.loads(data) or {}).get('progress', {}) if status == 200 else {}
+            if progress.get('status') in ('finished', 'error', 'not_found'):
+                results[task_id] = progress
+                pending.discard(task_id)
+        if pending:
+            time.sleep(0.05)
+    return results, pending
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='ytdl-bench-')
+    os.environ['STATE_DB_PATH'] = os.path.join(workdir, 'data', 'state.db')
+    os.environ.setdefault('TASK_STORE', 'sqlite')
+    os.environ.setdefault('DOWNLOAD_QUEUE_SIZE', str(max(args.jobs * 2, 50)))
+    fixture = FixtureServer(size=args.media_kb * 1024).start()
+    backend_class = GunicornBackend if args.mode == 'gunicorn' else TestClientBackend
+    backend = backend_class(workdir, fixture, args)
+    results = {}
+    try:
+        videos = [video_url(n) for n in range(args.videos)]
+
+        # Cold extractions for each video, then info cache hits
+        calls = [('POST', '/api/info', {'url': videos[i % len(videos)]}) for i in range(args.requests)]
+        results['info'], _ = run_load(backend, calls, args.concurrency)
+
+        # Health checks while slow_info uncached extractions hold the server
+        if args.slow_info:
+            slow_calls = [('POST', '/api/info', {'url': video_url(200000 + n)})
+                          for n in range(args.slow_info)]
+            slow = threading.Thread(
+                target=lambda: results.__setitem__(
+                    'info_slow', run_load(backend, slow_calls, args.slow_info)[0]))
+            slow.start()
+            time.sleep(0.2)
+            calls = [('GET', '/api/health', None)] * args.requests
+            results['health_during_extraction'], _ = run_load(backend, calls, args.concurrency)
+            slow.join()
+
+        # End-to-end: fresh videos from request to finished file
+        job_videos = [video_url(100000 + n) for n in range(args.jobs)]
+        started = time.perf_counter()
+        calls = [('POST', '/api/download', {'url': url, 'format': args.format}) for url in job_videos]
+        results['download_cold'], bodies = run_load(backend, calls, args.concurrency)
+        task_ids = [b['task_id'] for b in bodies if b and b.get('task_id')]
+        finished, pending = wait_for_tasks(backend, task_ids, args.job_timeout)
+        elapsed = time.perf_counter() - started
+        done = [p for p in finished.values() if p.get('status') == 'finished']
+        results['jobs'] = {
+            'jobs': args.jobs,
+            'finished': len(done),
+            'failed': len(finished) - len(done),
+            'timed_out': len(pending),
+            'seconds': round(elapsed, 4),
+            'jobs_per_second': round(len(done) / elapsed, 3) if elapsed else None,
+        }
+
+        # Repeat downloads of finished videos hit the output cache
+        calls = [
+            ('POST', '/api/download', {'url': job_videos[i % len(job_videos)], 'format': args.format})
+            for i in range(args.requests)
+        ] if job_videos else []
+        results['download'], _ = run_load(backend, calls, args.concurrency)
+
+        calls = [('GET', f'/api/progress/{task_ids[i % len(task_ids)]}', None)
+                 for i in range(args.requests)] if task_ids else []
+        results['progress'], _ = run_load(backend, calls, args.concurrency)
+
+        filenames = sorted({p['filename'] for p in done if p.get('filename')})
+        calls = [('GET', '/api/file/' + urllib.request.quote(filenames[i % len(filenames)]), None)
+                 for i in range(args.requests)] if filenames else []
+        results['file'], _ = run_load(backend, calls, args.concurrency)
+    finally:
+        backend.close()
+        fixture.stop()
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'meta': {
+            'mode': args.mode,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'jobs': args.jobs,
+            'videos': args.videos,
+            'format': args.format,
+            'media_kb': args.media_kb,
+            'extract_latency': args.extract_latency,
+            'slow_info': args.slow_info,
+            'worker_class': args.worker_class if args.mode == 'gunicorn' else None,
+            'workers': args.workers if args.mode == 'gunicorn' else None,
+            'threads': args.threads if args.mode == 'gunicorn' else None,
+        },
+        'results': results,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(report, baseline, threshold):
+    """Print per-endpoint changes, returns the regressions beyond threshold"""
+    regressions = []
+    if baseline.get('meta', {}).get('mode') != report['meta']['mode']:
+        print(f"Note: baseline ran in {baseline.get('meta', {}).get('mode')} mode, "
+              f"this run in {report['meta']['mode']} mode")
+    for name, current in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+        for key, higher_is_better in (('requests_per_second', True), ('p99_ms', False),
+                                      ('jobs_per_second', True)):
+            if current.get(key) is None or not previous.get(key):
+                continue
+            change = (current[key] - previous[key]) / previous[key]
+            worse = -change if higher_is_better else change
+            flag = ' REGRESSION' if worse > threshold else ''
+            print(f"{name:14} {key:20} {previous[key]:>12} -> {current[key]:>12} ({change:+.1%}){flag}")
+            if flag:
+                regressions.append((name, key, change))
+    return regressions
+
+
+def print_report(report):
+    for name, stats in report['results'].items():
+        if 'requests_per_second' in stats:
+            print(f"{name:14} {stats['requests']:>6} req  {stats['requests_per_second'] or 0:>9} req/s  "
+                  f"p50 {stats['p50_ms'] or 0:>9} ms  p99 {stats['p99_ms'] or 0:>9} ms  "
+                  f"errors {stats['errors']}")
+        else:
+            print(f"{name:14} {stats['finished']}/{stats['jobs']} finished  "
+                  f"{stats['jobs_per_second']} jobs/s  ({stats['seconds']} s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mode', choices=('client', 'gunicorn'), default='client')
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--jobs', type=int, default=20, help='end-to-end downloads')
+    parser.add_argument('--videos', type=int, default=20, help='distinct videos for /api/info')
+    parser.add_argument('--format', choices=('mp4', 'mp3'), default='mp4',
+                        help='mp3 needs a real ffmpeg on PATH')
+    parser.add_argument('--media-kb', type=int, default=512, help='fixture file size')
+    parser.add_argument('--extract-latency', type=float, default=0.0,
+                        help='seconds the fake extractor sleeps, to mimic YouTube')
+    parser.add_argument('--slow-info', type=int, default=0,
+                        help='uncached /api/info requests kept in flight while /api/health is measured')
+    parser.add_argument('--job-timeout', type=float, default=300)
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=16, help='gunicorn threads per worker')
+    parser.add_argument('--worker-class', choices=('sync', 'gthread', 'gevent'), default='gthread')
+    parser.add_argument('--worker-connections', type=int, default=1000,
+                        help='open requests per gevent worker')
+    parser.add_argument('--output', default=os.path.join('benchmarks', 'results', 'latest.json'))
+    parser.add_argument('--baseline', help='earlier results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown counted as a regression')
+    parser.add_argument('--keep-workdir', action='store_true')
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    report = run(args)
+    print_report(report)
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""
+Cold start and memory of the app, in-process and under gunicorn
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --repo /tmp/old-checkout   # compare a revision
+
+Measures how long `import app` takes in a fresh interpreter and what it
+leaves resident, then starts the real app under gunicorn with the repo's
+gunicorn.conf.py, with and without PRELOAD_YTDLP, and reports the time to
+the first healthy response and the RSS/PSS of the master and each worker,
+idle and again after a round of /api/info lookups has made the workers
+load yt-dlp. PSS splits shared pages between the processes mapping them,
+so it is the number that adds up to the memory a deployment actually
+uses. Linux only for the memory figures (/proc).
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = '''
+import resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, 'yt_dlp' in sys.modules)
+'''
+
+
+def import_cost(repo, workdir, module, runs):
+    """Median seconds and peak RSS (MB) of importing module in a new interpreter"""
+    times, rss = [], []
+    env = dict(os.environ, PYTHONPATH=repo)
+    for _ in range(runs):
+        out = subprocess.check_output(
+            [sys.executable, '-c', IMPORT_PROBE.format(module=module)],
+            cwd=workdir, env=env, stderr=subprocess.DEVNULL
+        ).decode().split()
+        times.append(float(out[0]))
+        rss.append(int(out[1]) / 1024)
+    return {
+        'seconds': round(statistics.median(times), 3),
+        'rss_mb': round(statistics.median(rss), 1),
+        'loads_yt_dlp': out[2] == 'True',
+    }
+
+
+def memory(pid):
+    """RSS and PSS of one process in MB, from smaps_rollup"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:'):
+                values[parts[0][:-1].lower() + '_mb'] = round(int(parts[1]) / 1024, 1)
+    return values
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(p) for p in f.read().split()]
+
+
+def snapshot(master):
+    workers = [memory(pid) for pid in children(master)]
+    return {
+        'master': memory(master),
+        'workers': workers,
+        'worker_pss_mb': round(statistics.mean(w['pss_mb'] for w in workers), 1),
+        'total_pss_mb': round(memory(master)['pss_mb'] + sum(w['pss_mb'] for w in workers), 1),
+    }
+
+
+def info_request(port, n):
+    body = json.dumps({'url': f'https://www.youtube.com/watch?v=startup{n:04d}'}).encode()
+    req = urllib.request.Request(
+        f'http://127.0.0.1:{port}/api/info', data=body, method='POST',
+        headers={'Content-Type': 'application/json'}
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=120) as r:
+            r.read()
+    except OSError:
+        pass
+
+
+def gunicorn_start(repo, workdir, args, preload):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    env = dict(
+        os.environ, PYTHONPATH=repo, PORT=str(port),
+        WEB_CONCURRENCY=str(args.workers), WORKER_CLASS=args.worker_class,
+        PRELOAD_YTDLP='1' if preload else '0',
+    )
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(repo, 'gunicorn.conf.py'),
+         '--log-level', 'warning', 'app:app'],
+        cwd=workdir, env=env,
+        stdout=subprocess.DEVNULL, stderr=open(os.path.join(workdir, 'gunicorn.log'), 'a')
+    )
+    try:
+        first_healthy = None
+        deadline = time.monotonic() + 120
+        while time.monotonic() < deadline and process.poll() is None:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=5) as r:
+                    if r.status == 200:
+                        first_healthy = time.perf_counter() - start
+                        break
+            except OSError:
+                time.sleep(0.05)
+        if first_healthy is None:
+            raise RuntimeError(f'gunicorn did not start, see {workdir}/gunicorn.log')
+
+        # Let the other workers finish booting before reading their memory
+        deadline = time.monotonic() + 60
+        while len(children(process.pid)) < args.workers and time.monotonic() < deadline:
+            time.sleep(0.1)
+        time.sleep(args.settle)
+        result = {
+            'preload_ytdlp': preload,
+            'first_healthy_seconds': round(first_healthy, 3),
+            'idle': snapshot(process.pid),
+        }
+        if args.warm:
+            # Lookups of unknown IDs make every worker that gets one load
+            # yt-dlp and the YouTube extractor (they fail without network)
+            with ThreadPoolExecutor(args.warm) as pool:
+                list(pool.map(lambda n: info_request(port, n), range(args.warm)))
+            time.sleep(args.settle)
+            result['warm'] = snapshot(process.pid)
+        return result
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repo', default=REPO_ROOT, help='checkout to measure')
+    parser.add_argument('--runs', type=int, default=5, help='import measurements per module')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--worker-class', choices=('gthread', 'gevent'), default='gthread')
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help='seconds to wait after startup before reading memory')
+    parser.add_argument('--warm', type=int, default=16,
+                        help='concurrent /api/info lookups before the second reading, 0 to skip')
+    parser.add_argument('--output', help='write the results as JSON')
+    args = parser.parse_args(argv)
+
+    repo = os.path.abspath(args.repo)
+    report = {'repo': repo, 'worker_class': args.worker_class}
+    with tempfile.TemporaryDirectory(prefix='ytdl-startup-') as workdir:
+        report['import_yt_dlp'] = import_cost(repo, workdir, 'yt_dlp', args.runs)
+        report['import_app'] = import_cost(repo, workdir, 'app', args.runs)
+        report['gunicorn'] = [
+            gunicorn_start(repo, workdir, args, preload) for preload in (False, True)
+        ]
+
+    for name in ('import_yt_dlp', 'import_app'):
+        r = report[name]
+        print(f"{name:14} {r['seconds']:>7} s  {r['rss_mb']:>7} MB  loads yt-dlp: {r['loads_yt_dlp']}")
+    for r in report['gunicorn']:
+        print(f"gunicorn preload_ytdlp={r['preload_ytdlp']!s:5}  first 200 after {r['first_healthy_seconds']} s")
+        for state in ('idle', 'warm'):
+            if state in r:
+                m = r[state]
+                print(f"  {state:5} master pss {m['master']['pss_mb']:>6} MB  worker pss {m['worker_pss_mb']:>6} MB  "
+                      f"total pss {m['total_pss_mb']:>6} MB")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,58 +1,130 @@
-from flask import jsonify, send_file
+from flask import Response, jsonify, redirect, request, send_file, stream_with_context
+from werkzeug.wsgi import ClosingIterator, FileWrapper
+from urllib.parse import quote
 import os
 import re
 import time
 import json
-from models.downloader import YouTubeDownloader
+import mimetypes
+import threading
+import unicodedata
+from models.cleanup import CleanupScheduler
+from models.downloader import YouTubeDownloader, has_video_id, make_job_key
+from models.file_locations import FileLocations
+from models.job_journal import create_job_journal
+from models.meta_store import MetaStore
+from models.metrics import metrics
+from models.offload import gevent_patched
+from models.output_cache import OutputCache
+from models.scheduler import QueueFullError
+from models.storage import Storage
+from models.zip_stream import stream_zip
 
-class DownloadController:
-    """Controller for handling download requests"""
+# Playlist and channel URLs pass the YouTube URL check but name no video
+NO_VIDEO_ID_ERROR = (
+    'This link is not a single video. Use the link of one video, '
+    'or download a playlist as a batch'
+)
+
+def content_disposition(filename):
+    """Attachment header value that survives non-ASCII filenames"""
+    try:
+        filename.encode('ascii')
+        return 'attachment; filename="{}"'.format(filename.replace('"', ''))
+    except UnicodeEncodeError:
+        fallback = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        return 'attachment; filename="{}"; filename*=UTF-8\'\'{}'.format(
+            fallback.replace('"', ''), quote(filename)
+        )
+
+def display_name(title, filename):
+    """Download name from the video title, keeping the stored file's extension"""
+    title = re.sub(r'[\x00-\x1f\x7f/\\]+', ' ', title or '').strip()
+    if not title:
+        return filename
+    return title + os.path.splitext(filename)[1]
+
+def count_served(chunks, delivery):
+    """Pass body chunks through, counting them as served bytes"""
+    for chunk in chunks:
+        metrics.inc('ytdl_served_bytes_total', len(chunk), delivery=delivery)
+        yield chunk
+
+class CloseHookFile:
+    """File proxy that runs on_close once, when the server closes the file
     
-    def __init__(self):
-        self.downloader = YouTubeDownloader()
-        self.downloads_meta_file = os.path.join(os.getcwd(), 'static', 'downloads', '.downloads_meta.json')
-        self._ensure_meta_file()
+    send_file bodies go to the server untouched, so it can use sendfile,
+    and Response.close() (with its call_on_close callbacks) never runs for
+    them; the server does close the file once the transfer ends.
+    """
     
-    def _ensure_meta_file(self):
-        """Ensure the downloads metadata file exists"""
-        try:
-            downloads_dir = os.path.dirname(self.downloads_meta_file)
-            os.makedirs(downloads_dir, exist_ok=True)
-            
-            if not os.path.exists(self.downloads_meta_file):
-                self._save_meta({})
-        except Exception as e:
-            print(f"Error creating meta file: {e}")
+    def __init__(self, file, on_close):
+        self._file = file
+        self._on_close = on_close
     
-    def _load_meta(self):
-        """Load downloads metadata"""
-        try:
-            if os.path.exists(self.downloads_meta_file):
-                with open(self.downloads_meta_file, 'r') as f:
-                    return json.load(f)
-            return {}
-        except Exception as e:
-            print(f"Error loading meta: {e}")
-            return {}
+    def __getattr__(self, name):
+        return getattr(self._file, name)
     
-    def _save_meta(self, meta):
-        """Save downloads metadata"""
+    def close(self):
         try:
-            with open(self.downloads_meta_file, 'w') as f:
-                json.dump(meta, f, indent=2)
-        except Exception as e:
-            print(f"Error saving meta: {e}")
+            self._file.close()
+        finally:
+            on_close, self._on_close = self._on_close, None
+            if on_close is not None:
+                on_close()
+
+class DownloadController:
+    """Controller for handling download requests"""
+    
+    def __init__(self):
+        # Every path into the downloads folder goes through the storage
+        # layout, shared with the downloader, cache and cleanup
+        self.storage = Storage(os.path.join(os.getcwd(), 'static', 'downloads'))
+        self.meta = MetaStore()
+        # JOB_QUEUE=sqlite makes this node one of several sharing a job
+        # queue; requests for another node's jobs and files go there
+        self.journal = create_job_journal()
+        self.locations = FileLocations(self.journal) if self.journal.shared else None
+        self.output_cache = OutputCache(
+            self.storage, meta_store=self.meta, locations=self.locations
+        )
+        self.downloader = YouTubeDownloader(
+            output_cache=self.output_cache, meta_store=self.meta, storage=self.storage,
+            journal=self.journal, locations=self.locations
+        )
+        self.cleanup = CleanupScheduler(
+            self.storage, self.meta, self.output_cache, locations=self.locations
+        )
+        
+        # "flask" streams files from this worker, "x-accel" hands them to nginx
+        self.file_delivery = os.getenv('FILE_DELIVERY', 'flask').lower()
+        self.accel_prefix = os.getenv('X_ACCEL_PREFIX', '/protected-downloads/')
+        
+        # Each live MP3 stream holds a request thread and an ffmpeg process
+        self.stream_slots = threading.BoundedSemaphore(int(os.getenv('MAX_CONCURRENT_STREAMS', 4)))
+        # Each progress stream holds a request thread (a greenlet under
+        # gevent) for minutes; past the cap clients fall back to polling
+        if gevent_patched():
+            default_sse = int(os.getenv('WORKER_CONNECTIONS', 1000)) // 2
+        else:
+            default_sse = int(os.getenv('GUNICORN_THREADS', 16)) // 4
+        self.sse_slots = threading.BoundedSemaphore(
+            max(1, int(os.getenv('MAX_SSE_STREAMS', default_sse)))
+        )
+        self.batch_max_items = int(os.getenv('BATCH_MAX_ITEMS', 50))
     
-    def _register_download(self, filename, task_id):
-        """Register a completed download"""
-        meta = self._load_meta()
-        meta[filename] = {
-            'task_id': task_id,
-            'created_at': time.time(),
-            'downloaded': False,
-            'download_count': 0
-        }
-        self._save_meta(meta)
+    def resume_jobs(self):
+        """Queue the journaled jobs of dead workers here, drop old journal rows"""
+        resumed = self.downloader.resume_interrupted()
+        self.downloader.journal.purge()
+        return resumed
+    
+    def migrate_legacy_meta(self):
+        """One-time import of the JSON file used by earlier versions
+        
+        Run by the process elected for background maintenance.
+        """
+        return self.meta.migrate_json(os.path.join(self.storage.root, '.downloads_meta.json'))
     
     def validate_youtube_url(self, url):
         """Validate if the URL is a valid YouTube URL"""
@@ -95,23 +167,39 @@ class DownloadController:
                     'error': 'Please provide a valid YouTube URL'
                 }), 400
             
-            if format_type not in ['mp3', 'mp4']:
+            if not has_video_id(url):
                 return jsonify({
                     'success': False,
-                    'error': 'Format must be mp3 or mp4'
+                    'error': NO_VIDEO_ID_ERROR
                 }), 400
             
-            # Get video info first
-            video_info = self.downloader.get_video_info(url)
-            if not video_info['success']:
+            if format_type not in ['mp3', 'mp4']:
                 return jsonify({
                     'success': False,
-                    'error': f'Failed to get video info: {video_info["error"]}'
+                    'error': 'Format must be mp3 or mp4'
                 }), 400
             
-            # Start download
-            download_path = os.path.join(os.getcwd(), 'static', 'downloads')
-            task_id = self.downloader.start_download(url, format_type, download_path)
+            # Get video info first, unless the output is already cached
+            video_info = None
+            cached_filename = self.output_cache.lookup(make_job_key(url, format_type))
+            if not cached_filename:
+                video_info = self.downloader.get_video_info(url)
+                if not video_info['success']:
+                    return jsonify({
+                        'success': False,
+                        'error': f'Failed to get video info: {video_info["error"]}'
+                    }), 400
+            
+            # Start download, with the cache lookup already done
+            try:
+                task_id = self.downloader.start_download(
+                    url, format_type, cached_filename=cached_filename, check_cache=False
+                )
+            except QueueFullError:
+                return jsonify({
+                    'success': False,
+                    'error': 'Server is busy, please try again in a minute'
+                }), 503, {'Retry-After': '30'}
             
             return jsonify({
                 'success': True,
@@ -126,18 +214,178 @@ class DownloadController:
                 'error': f'Server error: {str(e)}'
             }), 500
     
+    def batch(self, request):
+        """Start downloading a list of URLs or a playlist"""
+        try:
+            data = request.get_json()
+            
+            if not data:
+                return jsonify({
+                    'success': False,
+                    'error': 'No data provided'
+                }), 400
+            
+            format_type = data.get('format', 'mp3').lower()
+            if format_type not in ['mp3', 'mp4']:
+                return jsonify({
+                    'success': False,
+                    'error': 'Format must be mp3 or mp4'
+                }), 400
+            
+            urls = [u.strip() for u in data.get('urls') or [] if isinstance(u, str) and u.strip()]
+            playlist_url = (data.get('url') or '').strip()
+            
+            if not urls and not playlist_url:
+                return jsonify({
+                    'success': False,
+                    'error': 'Provide a list of URLs or a playlist URL'
+                }), 400
+            
+            for url in urls + ([playlist_url] if playlist_url else []):
+                if not self.validate_youtube_url(url):
+                    return jsonify({
+                        'success': False,
+                        'error': f'Not a valid YouTube URL: {url}'
+                    }), 400
+            
+            # Listed URLs are downloaded as single videos
+            for url in urls:
+                if not has_video_id(url):
+                    return jsonify({
+                        'success': False,
+                        'error': f'Not a link to a single video: {url}'
+                    }), 400
+            
+            if playlist_url:
+                urls += self.downloader.expand_playlist(playlist_url, self.batch_max_items)
+            
+            # Same video listed twice is downloaded once
+            urls = list(dict.fromkeys(urls))
+            if not urls:
+                return jsonify({
+                    'success': False,
+                    'error': 'The playlist has no downloadable videos'
+                }), 400
+            if len(urls) > self.batch_max_items:
+                return jsonify({
+                    'success': False,
+                    'error': f'A batch can hold at most {self.batch_max_items} videos'
+                }), 400
+            
+            batch_id = self.downloader.start_batch(urls, format_type)
+            
+            return jsonify({
+                'success': True,
+                'batch_id': batch_id,
+                'total': len(urls),
+                'message': f'Batch of {len(urls)} {format_type.upper()} downloads started'
+            })
+            
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }), 500
+    
+    def get_batch(self, batch_id):
+        """Get per-item and total progress of a batch"""
+        try:
+            batch = self.downloader.get_batch(batch_id)
+            if batch is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Batch not found'
+                }), 404
+            
+            return jsonify({
+                'success': True,
+                'batch': batch
+            })
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+    
+    def batch_zip(self, batch_id):
+        """Stream the finished files of a batch as one ZIP archive"""
+        try:
+            batch = self.downloader.get_batch(batch_id)
+            if batch is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Batch not found'
+                }), 404
+            
+            if batch['status'] != 'finished':
+                return jsonify({
+                    'success': False,
+                    'error': 'Batch is still downloading'
+                }), 409
+            
+            filenames = list(dict.fromkeys(
+                item['filename'] for item in batch['items']
+                if item['status'] == 'finished' and item['filename']
+            ))
+            if not filenames:
+                return jsonify({
+                    'success': False,
+                    'error': 'No files in this batch finished downloading'
+                }), 404
+            
+            for filename in filenames:
+                self.meta.record_download(filename)
+            
+            metrics.inc('ytdl_files_served_total', delivery='zip')
+            # Archive members are named after the titles, made unique
+            files = []
+            used = set()
+            for f in filenames:
+                path = self.storage.locate(f)
+                if path is None:
+                    continue
+                arcname = display_name((self.meta.get(f) or {}).get('title'), f)
+                if arcname in used:
+                    arcname = f
+                used.add(arcname)
+                files.append((path, arcname))
+            chunks = stream_zip(
+                files,
+                on_open=lambda path: self.output_cache.acquire(os.path.basename(path)),
+                on_close=lambda path: self.output_cache.release(os.path.basename(path))
+            )
+            return Response(
+                stream_with_context(count_served(chunks, 'zip')),
+                mimetype='application/zip',
+                headers={
+                    'Content-Disposition': content_disposition(f'{batch_id}.zip'),
+                    'X-Accel-Buffering': 'no'
+                }
+            )
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+    
+    def _node_redirect(self, node_url):
+        """Send the client to the same path on another node"""
+        return redirect(node_url + request.full_path.rstrip('?'), code=307)
+    
+    def _task_node(self, task_id):
+        """URL of the node holding a cluster task, None if it is local"""
+        if not self.journal.shared:
+            return None
+        return self.journal.remote_url(self.journal.get(task_id))
+    
     def get_progress(self, task_id):
         """Get download progress"""
         try:
+            node_url = self._task_node(task_id)
+            if node_url:
+                return self._node_redirect(node_url)
             progress = self.downloader.get_progress(task_id)
             
-            # If download is finished and has a filename, register it
-            if (progress.get('status') == 'finished' and 
-                progress.get('filename') and 
-                progress.get('filename') not in self._load_meta()):
-                
-                self._register_download(progress['filename'], task_id)
-            
             return jsonify({
                 'success': True,
                 'progress': progress
@@ -148,16 +396,74 @@ class DownloadController:
                 'error': str(e)
             }), 500
     
-    def serve_file(self, filename, download_folder):
-        """Serve downloaded file"""
-        try:
-            file_path = os.path.join(download_folder, filename)
+    def stream_progress(self, task_id, poll_interval=1.0, keepalive=15, max_duration=600):
+        """Push progress as Server-Sent Events until the task ends
+        
+        Updates made by this worker wake the stream immediately; updates
+        made by other workers are picked up every poll_interval seconds.
+        Unchanged states are not re-sent. Past MAX_SSE_STREAMS open streams
+        in this worker the answer is a 503, which makes the browser's
+        EventSource fail and the page poll /api/progress instead.
+        """
+        node_url = self._task_node(task_id)
+        if node_url:
+            return self._node_redirect(node_url)
+        if not self.sse_slots.acquire(blocking=False):
+            return jsonify({
+                'success': False,
+                'error': 'Too many progress streams, poll /api/progress instead'
+            }), 503, {'Retry-After': '30'}
+        events = self.downloader.progress_events
+        
+        def generate():
+            started = time.monotonic()
+            last_sent = started
+            last_payload = None
+            version = events.version(task_id)
             
-            if not os.path.exists(file_path):
-                # Log the missing file for debugging
-                print(f"File not found: {file_path}")
-                print(f"Available files: {os.listdir(download_folder) if os.path.exists(download_folder) else 'Directory not found'}")
+            while time.monotonic() - started < max_duration:
+                progress = self.downloader.get_progress(task_id)
+                payload = json.dumps({'success': True, 'progress': progress})
+                if payload != last_payload:
+                    yield f"data: {payload}\n\n"
+                    last_payload = payload
+                    last_sent = time.monotonic()
+                elif time.monotonic() - last_sent >= keepalive:
+                    yield ": keepalive\n\n"
+                    last_sent = time.monotonic()
                 
+                if progress.get('status') in ('finished', 'error', 'not_found'):
+                    return
+                version = events.wait(task_id, version, poll_interval)
+        
+        # The slot is freed when the server closes the response
+        return Response(
+            ClosingIterator(stream_with_context(generate()), self.sse_slots.release),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                # Tell nginx not to buffer the stream
+                'X-Accel-Buffering': 'no'
+            }
+        )
+    
+    def serve_file(self, filename):
+        """Serve downloaded file
+        
+        With FILE_DELIVERY=x-accel the transfer is handed to nginx through
+        X-Accel-Redirect and this worker is free immediately; otherwise the
+        file is streamed by Flask with ETag and Range support.
+        """
+        try:
+            file_path = self.storage.locate(filename)
+            
+            if file_path is None and self.locations is not None:
+                node_url = self.locations.remote_url(filename)
+                if node_url:
+                    return self._node_redirect(node_url)
+            
+            if file_path is None:
+                print(f"File not found: {filename}")
                 return jsonify({
                     'success': False,
                     'error': 'File not found'
@@ -170,23 +476,71 @@ class DownloadController:
                     'error': 'File not accessible'
                 }), 403
             
-            # Update download metadata
-            meta = self._load_meta()
-            if filename in meta:
-                meta[filename]['downloaded'] = True
-                meta[filename]['download_count'] += 1
-                meta[filename]['last_download'] = time.time()
-                self._save_meta(meta)
+            # Update download metadata, once per download rather than once
+            # per resumed range request
+            range_header = request.headers.get('Range', '')
+            if not range_header or range_header.startswith('bytes=0-'):
+                self.meta.record_download(filename)
             
             # Get file size for logging
             file_size = os.path.getsize(file_path)
             print(f"Serving file: {filename} ({file_size} bytes)")
             
-            return send_file(
-                file_path,
-                as_attachment=True,
-                download_name=filename
+            # Files are stored under their video ID, users get the title
+            file_meta = self.meta.get(filename) or {}
+            download_name = display_name(file_meta.get('title'), filename)
+            
+            if self.file_delivery == 'x-accel':
+                metrics.inc('ytdl_files_served_total', delivery='x-accel')
+                metrics.inc('ytdl_served_bytes_total', file_size, delivery='x-accel')
+                return self._accel_redirect(filename, file_path, download_name)
+            
+            # The body stays the server's file wrapper (sendfile); the file
+            # it wraps tells us when the transfer is over. The server checks
+            # the body against its wrapper type, so that is put back after
+            on_close = []
+            environ = request.environ
+            wrapper_type = environ.get('wsgi.file_wrapper')
+            wrap_file = wrapper_type or FileWrapper
+            environ['wsgi.file_wrapper'] = lambda file, buffer_size=8192: wrap_file(
+                CloseHookFile(file, lambda: [hook() for hook in on_close]), buffer_size
             )
+            try:
+                response = send_file(
+                    file_path,
+                    as_attachment=True,
+                    download_name=download_name,
+                    conditional=True,
+                    etag=True
+                )
+            finally:
+                if wrapper_type is None:
+                    environ.pop('wsgi.file_wrapper', None)
+                else:
+                    environ['wsgi.file_wrapper'] = wrapper_type
+            
+            # Keep the file out of cache eviction until the transfer ends
+            if request.method != 'HEAD' and response.status_code in (200, 206):
+                metrics.inc('ytdl_files_served_total', delivery='flask')
+                metrics.inc('ytdl_served_bytes_total', response.content_length or 0, delivery='flask')
+                self.output_cache.acquire(filename)
+                started = time.time()
+                
+                def transfer_done():
+                    self.output_cache.release(filename)
+                    # The serve span goes on the task that produced the file
+                    if file_meta.get('task_id'):
+                        self.downloader.record_span(
+                            file_meta['task_id'], 'serve', started, time.time() - started
+                        )
+                
+                if response.status_code == 206:
+                    # Range bodies are iterated rather than sent with
+                    # sendfile, and the range wrapper may not close the file
+                    response.response = ClosingIterator(response.response, transfer_done)
+                else:
+                    on_close.append(transfer_done)
+            return response
             
         except Exception as e:
             print(f"Error serving file {filename}: {str(e)}")
@@ -195,11 +549,27 @@ class DownloadController:
                 'error': str(e)
             }), 500
     
-    def get_video_info(self, request):
-        """Get video information without downloading"""
+    def _accel_redirect(self, filename, file_path, download_name):
+        """Let nginx send the file from its internal downloads location
+        
+        nginx handles Range, ETag and conditional requests for the file
+        itself. The transfer outlives this request, so the file is only
+        marked as recently used; an eviction during the transfer unlinks a
+        file nginx already has open, which is safe on POSIX.
+        """
+        self.output_cache.touch(filename)
+        response = Response(status=200)
+        # The internal location aliases the storage root, shards included
+        relpath = os.path.relpath(file_path, self.storage.root).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = self.accel_prefix + quote(relpath)
+        response.headers['Content-Type'] = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response.headers['Content-Disposition'] = content_disposition(download_name)
+        return response
+    
+    def stream_mp3(self, request):
+        """Send MP3 bytes while the video is still being fetched and encoded"""
         try:
-            data = request.get_json()
-            url = data.get('url', '').strip()
+            url = request.args.get('url', '').strip()
             
             if not url:
                 return jsonify({
@@ -213,81 +583,141 @@ class DownloadController:
                     'error': 'Please provide a valid YouTube URL'
                 }), 400
             
-            video_info = self.downloader.get_video_info(url)
-            return jsonify(video_info)
+            if not has_video_id(url):
+                return jsonify({
+                    'success': False,
+                    'error': NO_VIDEO_ID_ERROR
+                }), 400
             
-        except Exception as e:
+            # Already encoded: a regular (rangeable, cacheable) file download
+            cached_filename = self.output_cache.lookup(make_job_key(url, 'mp3'))
+            if cached_filename:
+                return redirect(f"/api/file/{quote(cached_filename)}")
+            
+            if not self.stream_slots.acquire(blocking=False):
+                return jsonify({
+                    'success': False,
+                    'error': 'Server is busy, please try again in a minute'
+                }), 503, {'Retry-After': '30'}
+            
+            try:
+                filename, title, chunks = self.downloader.stream_mp3(url)
+            except Exception:
+                self.stream_slots.release()
+                raise
+            
+            # The slot is freed when the server closes the response, even if
+            # the client disconnects before the first chunk
+            metrics.inc('ytdl_files_served_total', delivery='stream')
+            body = ClosingIterator(
+                stream_with_context(count_served(chunks, 'stream')), self.stream_slots.release
+            )
+            return Response(
+                body,
+                mimetype='audio/mpeg',
+                headers={
+                    'Content-Disposition': content_disposition(display_name(title, filename)),
+                    'X-Accel-Buffering': 'no'
+                }
+            )
+            
+        except ValueError as e:
             return jsonify({
                 'success': False,
                 'error': str(e)
+            }), 400
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': f'Server error: {str(e)}'
             }), 500
     
-    def cleanup_old_files(self, max_age_hours=24):
-        """Clean up old downloaded files"""
+    def get_video_info(self, request):
+        """Get video information without downloading"""
         try:
-            download_folder = os.path.join(os.getcwd(), 'static', 'downloads')
-            meta = self._load_meta()
-            current_time = time.time()
-            max_age_seconds = max_age_hours * 3600
-            
-            files_to_remove = []
-            
-            # Check each file in metadata
-            for filename, file_meta in meta.items():
-                file_path = os.path.join(download_folder, filename)
-                
-                # Skip if file doesn't exist anymore
-                if not os.path.exists(file_path):
-                    files_to_remove.append(filename)
-                    continue
-                
-                # Remove files older than max_age that have been downloaded
-                file_age = current_time - file_meta.get('created_at', 0)
-                has_been_downloaded = file_meta.get('downloaded', False)
-                
-                if file_age > max_age_seconds and has_been_downloaded:
-                    try:
-                        os.remove(file_path)
-                        files_to_remove.append(filename)
-                        print(f"Cleaned up old file: {filename}")
-                    except Exception as e:
-                        print(f"Error removing file {filename}: {e}")
+            data = request.get_json()
+            url = data.get('url', '').strip()
             
-            # Remove from metadata
-            for filename in files_to_remove:
-                meta.pop(filename, None)
+            if not url:
+                return jsonify({
+                    'success': False,
+                    'error': 'URL is required'
+                }), 400
             
-            # Save updated metadata
-            if files_to_remove:
-                self._save_meta(meta)
+            if not self.validate_youtube_url(url):
+                return jsonify({
+                    'success': False,
+                    'error': 'Please provide a valid YouTube URL'
+                }), 400
             
-            return len(files_to_remove)
+            video_info = self.downloader.get_video_info(url)
+            return jsonify(video_info)
             
         except Exception as e:
-            print(f"Error during cleanup: {e}")
-            return 0
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
     
     def get_stats(self):
-        """Get download statistics"""
+        """Get download statistics
+        
+        Answered from indexed tables and the metrics counters, never from
+        a listing of the download folder.
+        """
         try:
-            meta = self._load_meta()
-            download_folder = os.path.join(os.getcwd(), 'static', 'downloads')
-            
-            total_files = len(meta)
-            downloaded_files = sum(1 for m in meta.values() if m.get('downloaded', False))
-            total_downloads = sum(m.get('download_count', 0) for m in meta.values())
+            stats = self.meta.stats()
+            totals = metrics.collect()
             
-            # Check actual files on disk
-            actual_files = [f for f in os.listdir(download_folder) 
-                          if not f.startswith('.') and os.path.isfile(os.path.join(download_folder, f))]
+            hits = metrics.value(totals, 'ytdl_cache_requests_total', cache='output', result='hit')
+            misses = metrics.value(totals, 'ytdl_cache_requests_total', cache='output', result='miss')
             
             return {
-                'total_files': total_files,
-                'downloaded_files': downloaded_files,
-                'total_downloads': total_downloads,
-                'files_on_disk': len(actual_files),
-                'disk_files': actual_files
+                'total_files': stats['total_files'],
+                'downloaded_files': stats['downloaded_files'],
+                'total_downloads': stats['total_downloads'],
+                'jobs': {
+                    status: metrics.value(totals, 'ytdl_jobs_total', status=status)
+                    for status in ('finished', 'cached', 'error')
+                },
+                'queue_depth': metrics.value(totals, 'ytdl_queue_depth'),
+                'jobs_running': metrics.value(totals, 'ytdl_jobs_running'),
+                'cache': self.output_cache.stats(),
+                'cache_hit_ratio': hits / (hits + misses) if hits + misses else None,
+                'files_served': metrics.value(totals, 'ytdl_files_served_total'),
+                'bytes_served': metrics.value(totals, 'ytdl_served_bytes_total'),
+                'tasks': self.downloader.tasks.stats(),
+                'ydl_pool': self.downloader.ydl_pool.stats(),
+                'journal': self.downloader.journal.stats()
             }
         except Exception as e:
             print(f"Error getting stats: {e}")
             return {}
+
+    def list_files(self, request):
+        """One page of stored files, continued with ?after=<next>"""
+        try:
+            after = request.args.get('after') or None
+            try:
+                limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+            except ValueError:
+                limit = 100
+            
+            files = self.meta.page(after, limit)
+            for f in files:
+                f['size'] = self.storage.size(f['filename'])
+            
+            return jsonify({
+                'success': True,
+                'files': files,
+                'next': files[-1]['filename'] if len(files) == limit else None
+            })
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+
+    def get_metrics(self):
+        """Prometheus text format of all counters, summed over workers"""
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
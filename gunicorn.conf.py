@@ -0,0 +1,52 @@
+"""
+gunicorn settings, read automatically when gunicorn starts in this folder
+
+WORKER_CLASS=gthread (default) gives each worker a fixed number of request
+threads. WORKER_CLASS=gevent runs each worker as one event loop: requests
+are greenlets, so a worker holds WORKER_CONNECTIONS open requests (progress
+streams, file transfers) and yt-dlp extractions wait on a native thread
+pool (EXTRACT_WORKERS) without blocking anything else.
+
+With PRELOAD_YTDLP (default on) the master imports yt-dlp and its YouTube
+extractor once, before forking, so workers start without that cost and
+share those pages instead of each holding a copy. PRELOAD_APP also imports
+the Flask app in the master; either way each worker builds its own
+controller (database connections, pools, job threads) after the fork.
+"""
+import gc
+import os
+
+worker_class = os.getenv('WORKER_CLASS', 'gthread')
+if worker_class == 'gevent':
+    # Patch before anything is imported in the master, so modules loaded
+    # here and inherited by the workers see gevent's threading and socket
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv('WEB_CONCURRENCY', 4))
+# Per-process pools (transcoding) split the host's CPUs between the workers
+os.environ['WEB_CONCURRENCY'] = str(workers)
+threads = int(os.getenv('GUNICORN_THREADS', 16))
+worker_connections = int(os.getenv('WORKER_CONNECTIONS', 1000))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 300))
+preload_app = os.getenv('PRELOAD_APP', '').lower() in ('1', 'true', 'yes')
+
+
+def on_starting(server):
+    if os.getenv('PRELOAD_YTDLP', '1').lower() in ('1', 'true', 'yes'):
+        from models.ydl_pool import preload
+        preload()
+        server.log.info("Preloaded yt-dlp in the master")
+
+
+def pre_fork(server, worker):
+    # Keep the collector from writing to the objects inherited from the
+    # master, so their pages stay shared with it instead of being copied
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    # Build the controller before taking requests rather than on the first one
+    from app import get_controller
+    get_controller()
@@ -0,0 +1,129 @@
+import os
+import shutil
+import time
+
+# Leftovers of yt-dlp, ffmpeg and the stream/transcode pipelines
+PARTIAL_SUFFIXES = ('.part', '.ytdl', '.temp', '.encoding')
+
+
+class CleanupScheduler:
+    """Removes expired, abandoned and partial files a little at a time
+
+    Every call to tick() does a bounded amount of work, so it can run
+    every minute without a long pause, instead of a full pass over the
+    folder every few hours:
+
+    - expired files are taken from the expires_at index of the meta store
+    - when free disk space drops below min_free_bytes, the least recently
+      used files are removed ahead of their expiry
+    - a walk over the storage shards that resumes where the previous tick stopped
+      deletes partial files and untracked outputs nobody has touched for
+      orphan_age_seconds
+    Files pinned by a running transfer are never deleted.
+    """
+
+    def __init__(self, storage, meta, output_cache, batch_size=None,
+                 min_free_bytes=None, orphan_age_seconds=None, locations=None):
+        self.storage = storage
+        self.meta = meta
+        self.output_cache = output_cache
+        # Cluster file registry, told about every removed output
+        self.locations = locations
+        self.batch_size = batch_size or int(os.getenv('CLEANUP_BATCH_SIZE', 100))
+        if min_free_bytes is None:
+            min_free_bytes = int(os.getenv('MIN_FREE_DISK_MB', 1024)) * 1024 * 1024
+        self.min_free_bytes = min_free_bytes
+        self.orphan_age_seconds = orphan_age_seconds or float(os.getenv('ORPHAN_AGE_HOURS', 2)) * 3600
+        self._scan = None
+
+    def tick(self):
+        """Run one slice of cleanup, returns the number of files removed"""
+        now = time.time()
+        removed = self._expire(now)
+        removed += self._enforce_free_space(now)
+        removed += self._scan_step(now)
+        return removed
+
+    def _expire(self, now):
+        filenames = self.meta.expired(now, self.batch_size)
+        return self._remove_tracked(filenames, now)
+
+    def _enforce_free_space(self, now):
+        if not self.min_free_bytes:
+            return 0
+        try:
+            free = shutil.disk_usage(self.storage.root).free
+        except OSError:
+            return 0
+        if free >= self.min_free_bytes:
+            return 0
+
+        removed = 0
+        for filename in self.meta.least_recently_used(self.batch_size):
+            if free >= self.min_free_bytes:
+                break
+            size = self.storage.size(filename) or 0
+            if self._remove_tracked([filename], now):
+                free += size
+                removed += 1
+        if removed:
+            print(f"Low disk space: removed {removed} least recently used files")
+        return removed
+
+    def _remove_tracked(self, filenames, now):
+        """Delete files and their meta/cache entries, skipping pinned ones"""
+        removed = []
+        for filename in filenames:
+            if self.output_cache.in_use(filename):
+                # Check again once the transfer has had time to finish
+                self.meta.extend(filename, now + self.output_cache.ref_lease_seconds)
+                continue
+            try:
+                if self.storage.remove(filename):
+                    print(f"Cleaned up old file: {filename}")
+            except Exception as e:
+                print(f"Error removing file {filename}: {e}")
+                continue
+            removed.append(filename)
+
+        if removed:
+            self.meta.delete(removed)
+            for filename in removed:
+                self.output_cache.forget(filename)
+            if self.locations is not None:
+                self.locations.forget(removed)
+        return len(removed)
+
+    def _scan_step(self, now):
+        """Look at the next batch_size files of the storage walk"""
+        if self._scan is None:
+            self._scan = self.storage.scan()
+
+        removed = 0
+        for _ in range(self.batch_size):
+            entry = next(self._scan, None)
+            if entry is None:
+                # End of the walk: the next tick starts a fresh pass
+                self._scan = None
+                break
+            if entry.name.startswith('.'):
+                continue
+            try:
+                if now - entry.stat().st_mtime < self.orphan_age_seconds:
+                    continue
+            except FileNotFoundError:
+                continue
+
+            # Finished outputs are owned by their expiry, everything else is
+            # an interrupted download or a file nobody registered
+            if not entry.name.endswith(PARTIAL_SUFFIXES) and self.meta.contains(entry.name):
+                continue
+            try:
+                os.remove(entry.path)
+                removed += 1
+                print(f"Removed abandoned file: {entry.name}")
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Error removing file {entry.name}: {e}")
+        return removed
@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from models.offload import gevent_patched
+
+DEFAULT_DB_PATH = os.path.join(os.getcwd(), 'data', 'state.db')
+
+# Seconds a statement waits for another process's write lock
+BUSY_TIMEOUT = 30
+
+
+def get_db_path():
+    """Path of the SQLite database shared by all workers"""
+    return os.getenv('STATE_DB_PATH', DEFAULT_DB_PATH)
+
+
+class Database:
+    """Thin SQLite wrapper shared by every gunicorn worker
+
+    Each thread (and each forked process) gets its own connection, and the
+    database runs in WAL mode so readers never block the writer. Under
+    gevent that means each native thread: greenlets of one thread share
+    its connection rather than opening one per request. sqlite calls
+    never yield to another greenlet, so their statements can't interleave.
+    For the same reason sqlite's own busy wait would stall the event loop
+    while another process holds the write lock, so under gevent a locked
+    database is retried here with cooperative sleeps instead.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or get_db_path()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._cooperative = gevent_patched()
+        if self._cooperative:
+            from gevent import monkey
+            self._local = monkey.get_original('threading', 'local')()
+        else:
+            self._local = threading.local()
+
+    @property
+    def conn(self):
+        """Connection for the current thread, reopened after a fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            busy_timeout = 0 if self._cooperative else BUSY_TIMEOUT
+            conn = sqlite3.connect(
+                self.path,
+                timeout=busy_timeout,
+                isolation_level=None,
+                check_same_thread=False
+            )
+            conn.row_factory = sqlite3.Row
+            self._retry(conn.execute, 'PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA busy_timeout={int(busy_timeout * 1000)}')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _retry(self, func, *args):
+        """Call func, waiting cooperatively while the database is locked (gevent)"""
+        if not self._cooperative:
+            return func(*args)
+        deadline = time.monotonic() + BUSY_TIMEOUT
+        delay = 0.001
+        while True:
+            try:
+                return func(*args)
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e) or time.monotonic() >= deadline:
+                    raise
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def execute(self, sql, params=()):
+        """Run a single statement in autocommit mode"""
+        return self._retry(self.conn.execute, sql, params)
+
+    def executescript(self, script):
+        """Run several statements, used for schema setup"""
+        self._retry(self.conn.executescript, script)
+
+    @contextmanager
+    def transaction(self):
+        """Write transaction that takes the lock up front"""
+        conn = self.conn
+        self._retry(conn.execute, 'BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
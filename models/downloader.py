@@ -1,112 +1,210 @@
-import yt_dlp
+import glob
 import os
+import random
+import re
 import threading
 import time
-from datetime import datetime
+import uuid
+from concurrent.futures import as_completed
+from models.format_planner import plan_format
+from models.info_cache import InfoCache
+from models.job_journal import create_job_journal
+from models.metrics import metrics
+from models.offload import blocking_pool
+from models.progress_events import ProgressBroker
+from models.scheduler import JobScheduler, QueueFullError
+from models.storage import Storage
+from models.strategy_stats import StrategyStats
+from models.stream_transcoder import StreamTranscoder, select_audio_format
+from models.task_store import ACTIVE_STATUSES, create_task_store
+from models.tracing import SamplingProfiler, TaskTrace
+from models.transcoder import TranscodePool
+from models.ydl_pool import YoutubeDLPool
+
+# Output quality per format, part of the job identity
+FORMAT_QUALITY = {
+    'mp3': '192',
+    'mp4': '720',
+}
+
+# Quality of the basic configuration tried when the primary one fails
+FALLBACK_QUALITY = {
+    'mp3': '128',
+    'mp4': '360',
+}
+
+VIDEO_ID_PATTERN = re.compile(
+    r'(?:v=|/v/|youtu\.be/|/embed/|/shorts/|/live/)([0-9A-Za-z_-]{11})'
+)
+
+
+def extract_video_id(url):
+    """Return the 11 character YouTube video ID, or the URL if none is found"""
+    match = VIDEO_ID_PATTERN.search(url)
+    return match.group(1) if match else url.strip()
+
+
+def has_video_id(url):
+    """Whether the URL names a single video (playlist and channel URLs don't)"""
+    return VIDEO_ID_PATTERN.search(url) is not None
+
+
+def make_job_key(url, format_type, quality=None):
+    """Idempotency key for a download job, url may also be a bare video ID"""
+    quality = quality or FORMAT_QUALITY.get(format_type, '')
+    return f"{extract_video_id(url)}:{format_type}:{quality}"
+
+
+def output_job_key(filename):
+    """Job key of the output an output_template name describes, or None
+    
+    The name carries the quality the file was actually made at, which is
+    the fallback's when the primary configuration failed.
+    """
+    parts = os.path.splitext(filename)[0].rsplit('-', 2)
+    if len(parts) != 3 or parts[1] not in FORMAT_QUALITY:
+        return None
+    return make_job_key(*parts)
+
+
+def output_template(storage, video_id, format_type, quality):
+    """yt-dlp output template naming files by video ID, format and quality
+    
+    Titles stay out of the filesystem: two videos with the same title can't
+    overwrite each other and odd characters never reach a path. The title
+    is only used for Content-Disposition when the file is served. The
+    template points into the storage shard of the expected name, so every
+    intermediate file of the job lands in the same directory.
+    """
+    stem = f'{video_id}-{format_type}-{quality}'
+    shard_dir = os.path.dirname(storage.prepare(stem))
+    return os.path.join(shard_dir, f'%(id)s-{format_type}-{quality}.%(ext)s')
+
+
+# yt-dlp configurations tried in order when extracting video info
+INFO_CONFIGS = [
+    # Config 1: Standard with basic geo-bypass
+    {
+        'quiet': True,
+        'no_warnings': True,
+        'extractaudio': False,
+        'noplaylist': True,
+        'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+        'geo_bypass': True,
+        'geo_bypass_country': 'US',
+        'format': 'best/bestvideo+bestaudio/worst',  # More flexible format selection
+        'ignoreerrors': True,
+        'extract_flat': False,
+    },
+    # Config 2: Mobile user agent with Canada bypass
+    {
+        'quiet': True,
+        'no_warnings': True,
+        'extractaudio': False,
+        'noplaylist': True,
+        'user_agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 14_6 like Mac OS X) AppleWebKit/605.1.15',
+        'geo_bypass': True,
+        'geo_bypass_country': 'CA',
+        'format': 'worst/best',  # Try worst quality first to ensure availability
+        'ignoreerrors': True,
+    },
+    # Config 3: Most permissive with multiple bypasses
+    {
+        'quiet': True,
+        'no_warnings': True,
+        'extractaudio': False,
+        'noplaylist': True,
+        'user_agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36',
+        'geo_bypass': True,
+        'geo_bypass_country': 'GB',
+        'format': 'mp4/worst',  # Try basic mp4 format
+        'ignoreerrors': True,
+        'extractor_args': {'youtube': {'skip': ['dash']}},  # Skip DASH formats which can be problematic
+    },
+    # Config 4: Ultra-basic extraction
+    {
+        'quiet': True,
+        'no_warnings': True,
+        'extractaudio': False,
+        'noplaylist': True,
+        'format': '18/worst',  # Format 18 is basic 360p mp4, widely available
+        'ignoreerrors': True,
+        'youtube_include_dash_manifest': False,
+    }
+]
+
 
 class YouTubeDownloader:
     """Model for handling YouTube downloads"""
     
-    def __init__(self):
-        self.progress_data = {}
-        self.download_threads = {}
+    def __init__(self, task_store=None, scheduler=None, transcoder=None,
+                 output_cache=None, info_cache=None, meta_store=None, storage=None,
+                 ydl_pool=None, journal=None, locations=None):
+        # Task state lives in a pluggable store so any worker can answer
+        # progress requests; the worker pool is local to this process
+        self.tasks = task_store or create_task_store()
+        self.scheduler = scheduler or JobScheduler()
+        # Queued and running jobs are journaled, so the ones a dead worker
+        # leaves behind can be resumed elsewhere
+        self.journal = journal or create_job_journal()
+        # Interrupted runs before a job is given up
+        self.max_attempts = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+        # With a shared journal, finished files are recorded per node
+        self.locations = locations
+        metrics.gauge('ytdl_queue_depth', lambda: self.scheduler.stats()['queued'])
+        metrics.gauge('ytdl_jobs_running', lambda: sum(self.scheduler.stats()['running'].values()))
+        self.storage = storage or Storage()
+        self.output_cache = output_cache
+        # Registering a finished file starts its expiry clock
+        self.meta_store = meta_store
+        self.info_cache = info_cache or InfoCache()
+        self.progress_events = ProgressBroker()
+        # Items of one batch that may be queued or running at the same time
+        self.batch_parallelism = int(os.getenv('BATCH_PARALLELISM', 3))
+        # Minimum seconds between two stored progress percentages
+        self.progress_interval = float(os.getenv('PROGRESS_UPDATE_INTERVAL', 0.5))
+        # Fraction of downloads that run under the sampling profiler
+        self.profile_sample_rate = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+        self.profile_dir = os.getenv('PROFILE_DIR', os.path.join(os.getcwd(), 'logs', 'profiles'))
+        
+        # yt-dlp extractions run on their own pool: the request only waits,
+        # so under gevent the event loop keeps serving other requests
+        self.extract_pool = blocking_pool(int(os.getenv('EXTRACT_WORKERS', 8)), 'extract')
+        # Configured YoutubeDL instances (and their HTTP sessions) outlive
+        # the task that used them
+        self.ydl_pool = ydl_pool or YoutubeDLPool()
+        self.stream_transcoder = StreamTranscoder(ydl_pool=self.ydl_pool)
+        
+        # Extraction strategies are reordered by their recent track record;
+        # optionally the top two race each other
+        self.strategy_stats = StrategyStats(len(INFO_CONFIGS))
+        self.race_extraction = os.getenv('EXTRACTION_RACE', '').lower() in ('1', 'true', 'yes')
+        
+        # Pipeline mode: download workers only fetch, MP3 encoding runs on
+        # a separate pool so network and CPU work don't share one budget
+        if transcoder is None and os.getenv('TRANSCODE_PIPELINE', '').lower() in ('1', 'true', 'yes'):
+            transcoder = TranscodePool()
+        self.transcoder = transcoder
+        
+        if self.journal.shared:
+            # Jobs queued by any node are pulled whenever a worker is free
+            self.pull_interval = float(os.getenv('JOB_POLL_INTERVAL', 1))
+            threading.Thread(target=self._pull_jobs, name='job-puller', daemon=True).start()
     
     def get_video_info(self, url):
         """Get video information with enhanced format detection and geo-bypass"""
-        try:
-            error_msg = "Failed to get video information"
-            
-            # Multiple configurations with different strategies
-            ydl_configs = [
-                # Config 1: Standard with basic geo-bypass
-                {
-                    'quiet': True,
-                    'no_warnings': True,
-                    'extractaudio': False,
-                    'noplaylist': True,
-                    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                    'geo_bypass': True,
-                    'geo_bypass_country': 'US',
-                    'format': 'best/bestvideo+bestaudio/worst',  # More flexible format selection
-                    'ignoreerrors': True,
-                    'extract_flat': False,
-                },
-                # Config 2: Mobile user agent with Canada bypass
-                {
-                    'quiet': True,
-                    'no_warnings': True,
-                    'extractaudio': False,
-                    'noplaylist': True,
-                    'user_agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 14_6 like Mac OS X) AppleWebKit/605.1.15',
-                    'geo_bypass': True,
-                    'geo_bypass_country': 'CA',
-                    'format': 'worst/best',  # Try worst quality first to ensure availability
-                    'ignoreerrors': True,
-                },
-                # Config 3: Most permissive with multiple bypasses
-                {
-                    'quiet': True,
-                    'no_warnings': True,
-                    'extractaudio': False,
-                    'noplaylist': True,
-                    'user_agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36',
-                    'geo_bypass': True,
-                    'geo_bypass_country': 'GB',
-                    'format': 'mp4/worst',  # Try basic mp4 format
-                    'ignoreerrors': True,
-                    'extractor_args': {'youtube': {'skip': ['dash']}},  # Skip DASH formats which can be problematic
-                },
-                # Config 4: Ultra-basic extraction
-                {
-                    'quiet': True,
-                    'no_warnings': True,
-                    'extractaudio': False,
-                    'noplaylist': True,
-                    'format': '18/worst',  # Format 18 is basic 360p mp4, widely available
-                    'ignoreerrors': True,
-                    'youtube_include_dash_manifest': False,
-                }
-            ]
-            
-            last_error = None
-            
-            for i, ydl_opts in enumerate(ydl_configs):
-                try:
-                    print(f"Trying config {i+1}/4: {ydl_opts.get('geo_bypass_country', 'no-bypass')}")
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                        info = ydl.extract_info(url, download=False)
-                        
-                        if info is None:
-                            print(f"Config {i+1}: No info returned")
-                            continue
-                        
-                        # Check if we have any formats available
-                        formats = info.get('formats', [])
-                        if not formats and i < 3:  # Don't fail on last attempt
-                            print(f"Config {i+1}: No formats available, trying next")
-                            continue
-                        
-                        print(f"✅ Success with config {i+1}")
-                        return {
-                            'success': True,
-                            'title': info.get('title', 'Unknown'),
-                            'duration': info.get('duration', 0),
-                            'thumbnail': info.get('thumbnail', ''),
-                            'uploader': info.get('uploader', 'Unknown'),
-                            'view_count': info.get('view_count', 0),
-                            'available_formats': len(formats)
-                        }
-                except Exception as e:
-                    last_error = str(e)
-                    print(f"❌ Config {i+1} failed: {last_error}")
-                    continue
-            
-            # If all configs failed
-            error_msg = last_error or "All extraction methods failed"
-            
-        except Exception as e:
-            error_msg = str(e)
-            
+        info, error_msg = self._extract_info(url)
+        if info is not None:
+            return {
+                'success': True,
+                'title': info.get('title', 'Unknown'),
+                'duration': info.get('duration', 0),
+                'thumbnail': info.get('thumbnail', ''),
+                'uploader': info.get('uploader', 'Unknown'),
+                'view_count': info.get('view_count', 0),
+                'available_formats': len(info.get('formats') or [])
+            }
+        
         # Process error message
         print(f"Final yt-dlp error: {error_msg}")
         
@@ -130,56 +228,216 @@ class YouTubeDownloader:
             'error': error_msg
         }
     
-    def download_video(self, url, format_type, download_path, task_id):
-        """Download video in specified format"""
+    def _extract_info(self, url):
+        """Extract the full info dict, reusing a cached one when possible
+        
+        Returns (info, None) on success or (None, error_message).
+        """
+        video_id = extract_video_id(url)
+        info = self.info_cache.get(video_id)
+        if info is not None:
+            return info, None
+        
         try:
-            self.progress_data[task_id] = {
-                'status': 'starting',
-                'progress': 0,
-                'filename': None,
-                'error': None,
-                'format': format_type,
-                'download_path': download_path
-            }
+            error_msg = "Failed to get video information"
+            last_error = None
+            
+            # Most promising strategy first, based on recent outcomes
+            order = self.strategy_stats.order()
+            final = order[-1]
+            
+            if self.race_extraction and len(order) > 1:
+                info, error = self._race_configs(url, order[:2], final)
+                last_error = error or last_error
+                order = order[2:]
+                if info is not None:
+                    self.info_cache.put(video_id, info)
+                    return info, None
+            
+            for i in order:
+                info, error = self.extract_pool.submit(self._try_config, url, i, i == final).result()
+                last_error = error or last_error
+                if info is not None:
+                    self.info_cache.put(video_id, info)
+                    return info, None
+            
+            # If all configs failed
+            error_msg = last_error or "All extraction methods failed"
+            
+        except Exception as e:
+            error_msg = str(e)
+        
+        return None, error_msg
+    
+    def _try_config(self, url, i, allow_no_formats=False):
+        """Run one extraction strategy, returns (info, error)"""
+        ydl_opts = INFO_CONFIGS[i]
+        started = time.monotonic()
+        info = None
+        error = None
+        try:
+            print(f"Trying config {i+1}/4: {ydl_opts.get('geo_bypass_country', 'no-bypass')}")
+            with self.ydl_pool.checkout(f'info:{i}', ydl_opts) as ydl:
+                raw_info = ydl.extract_info(url, download=False)
+                
+                if raw_info is None:
+                    print(f"Config {i+1}: No info returned")
+                # Check if we have any formats available
+                elif not raw_info.get('formats') and not allow_no_formats:
+                    print(f"Config {i+1}: No formats available, trying next")
+                else:
+                    print(f"✅ Success with config {i+1}")
+                    info = ydl.sanitize_info(raw_info)
+        except Exception as e:
+            error = str(e)
+            print(f"❌ Config {i+1} failed: {error}")
+        
+        elapsed = time.monotonic() - started
+        self.strategy_stats.record(i, info is not None, elapsed)
+        metrics.observe(
+            'ytdl_extraction_seconds', elapsed,
+            config=str(i + 1), outcome='success' if info is not None else 'failure'
+        )
+        return info, error
+    
+    def _race_configs(self, url, indexes, final):
+        """Run strategies in parallel, first success wins
+        
+        A strategy that has not started yet is cancelled; one already in
+        flight can't be interrupted, so its result is simply dropped.
+        """
+        futures = [
+            self.extract_pool.submit(self._try_config, url, i, i == final)
+            for i in indexes
+        ]
+        last_error = None
+        try:
+            for future in as_completed(futures):
+                info, error = future.result()
+                last_error = error or last_error
+                if info is not None:
+                    return info, None
+        finally:
+            for future in futures:
+                future.cancel()
+        return None, last_error
+    
+    def download_video(self, url, format_type, task_id):
+        """Download video in specified format
+        
+        Time spent in each stage (queue, extract, fetch, fallback,
+        postprocess, transcode) is stored on the task as 'spans',
+        and a PROFILE_SAMPLE_RATE fraction of tasks is also profiled.
+        """
+        self.journal.start(task_id)
+        record = self.tasks.get(task_id) or {}
+        trace = TaskTrace(origin=record.get('created_at'))
+        if record.get('created_at'):
+            trace.add('queue', record['created_at'], time.time() - record['created_at'])
+        
+        profiler = None
+        if self.profile_sample_rate and random.random() < self.profile_sample_rate:
+            profiler = SamplingProfiler().start()
+        
+        handed_off = False
+        try:
+            handed_off = self._download(url, format_type, task_id, trace)
+        finally:
+            if profiler is not None:
+                self._save_profile(task_id, profiler)
+            # A transcode hand-off saves the spans when the encode ends
+            if not handed_off:
+                trace.close_all()
+                self._save_trace(task_id, trace)
+    
+    def _download(self, url, format_type, task_id, trace):
+        """Run the download, returns True if it was handed to the transcode pool"""
+        try:
+            self._update_task(task_id, status='starting', queue_position=None)
+            trace.start('extract')
+            
+            last_report = [0.0]
             
             def progress_hook(d):
                 if d['status'] == 'downloading':
+                    # The first chunk ends extraction and format selection
+                    if not trace.is_open('fetch'):
+                        trace.switch('extract', 'fetch')
+                        self._save_trace(task_id, trace)
+                    
+                    # yt-dlp calls this for every chunk; only store a few
+                    # updates per second and let the rest coalesce
+                    now = time.monotonic()
+                    if now - last_report[0] < self.progress_interval:
+                        return
+                    last_report[0] = now
                     try:
                         percent = float(d.get('_percent_str', '0%').replace('%', ''))
-                        self.progress_data[task_id]['progress'] = percent
-                        self.progress_data[task_id]['status'] = 'downloading'
+                        self._update_task(task_id, progress=percent, status='downloading')
                     except:
                         pass
                 elif d['status'] == 'finished':
-                    self.progress_data[task_id]['status'] = 'processing'
-                    self.progress_data[task_id]['progress'] = 95
+                    trace.end('extract')
+                    trace.end('fetch')
+                    fetched = d.get('total_bytes') or d.get('downloaded_bytes') or 0
+                    metrics.inc('ytdl_download_bytes_total', fetched)
+                    if fetched and d.get('elapsed'):
+                        metrics.observe(
+                            'ytdl_download_throughput_bytes_per_second', fetched / d['elapsed']
+                        )
                     
-                    # Store the base filename for later
-                    filename = os.path.basename(d['filename'])
-                    filename_without_ext = os.path.splitext(filename)[0]
-                    self.progress_data[task_id]['base_filename'] = filename_without_ext
+                    self._update_task(
+                        task_id,
+                        status='processing',
+                        progress=95,
+                        title=(d.get('info_dict') or {}).get('title')
+                    )
+            
+            postprocess_started = {}
             
             def postprocessor_hook(d):
+                name = d.get('postprocessor', 'unknown')
+                if d['status'] == 'started':
+                    postprocess_started[name] = time.monotonic()
+                    trace.start(f'postprocess:{name}')
+                elif d['status'] == 'finished' and name in postprocess_started:
+                    trace.end(f'postprocess:{name}')
+                    metrics.observe(
+                        'ytdl_postprocess_seconds',
+                        time.monotonic() - postprocess_started.pop(name),
+                        postprocessor=name
+                    )
+                
                 if d['status'] == 'finished':
                     # Final processing complete
-                    self.progress_data[task_id]['status'] = 'completed'
-                    self.progress_data[task_id]['progress'] = 100
-                    
-                    # Find the actual file that was created
-                    self._find_final_filename(task_id)
+                    self._update_task(task_id, status='completed', progress=100)
+            
+            outputs = []
+            
+            def post_hook(filepath):
+                # yt-dlp passes the final path once every postprocessor ran,
+                # so there is nothing to search for. An ID that differs from
+                # the one parsed from the URL lands in another shard
+                filepath = self.storage.place(filepath)
+                outputs.append(filepath)
+                if pipeline:
+                    self._update_task(task_id, source_file=filepath)
+                else:
+                    self._mark_finished(task_id, os.path.basename(filepath), trace)
+            
+            pipeline = self.transcoder is not None and format_type == 'mp3'
+            video_id = extract_video_id(url)
             
             # Configure download options based on format with fallback strategies
             if format_type == 'mp3':
                 ydl_opts = {
                     'format': 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/worst',  # More permissive audio selection
-                    'outtmpl': os.path.join(download_path, '%(title)s.%(ext)s'),
+                    'continuedl': True,  # Resume the .part file of an interrupted job
                     'postprocessors': [{
                         'key': 'FFmpegExtractAudio',
                         'preferredcodec': 'mp3',
                         'preferredquality': '192',
                     }],
-                    'progress_hooks': [progress_hook],
-                    'postprocessor_hooks': [postprocessor_hook],
                     'noplaylist': True,
                     'extractaudio': True,
                     'audioformat': 'mp3',
@@ -195,9 +453,7 @@ class YouTubeDownloader:
             else:  # mp4
                 ydl_opts = {
                     'format': 'best[height<=720][ext=mp4]/best[height<=480][ext=mp4]/worst[ext=mp4]/18/worst',  # More fallbacks including format 18
-                    'outtmpl': os.path.join(download_path, '%(title)s.%(ext)s'),
-                    'progress_hooks': [progress_hook],
-                    'postprocessor_hooks': [postprocessor_hook],
+                    'continuedl': True,  # Resume the .part file of an interrupted job
                     'noplaylist': True,
                     'merge_output_format': 'mp4',
                     'ignoreerrors': True,  # Don't fail completely on minor errors
@@ -209,26 +465,53 @@ class YouTubeDownloader:
                     'extractor_args': {'youtube': {'skip': ['dash']}},
                 }
             
+            bitrate = '192'
+            hooks = {'progress': progress_hook, 'postprocessor': postprocessor_hook, 'post': post_hook}
+            
+            # Info extracted by /api/info or /api/download is reused so the
+            # page is not extracted a second time
+            info = self.info_cache.get(video_id)
+            
+            # Pick the source that needs the least ffmpeg work
+            plan = plan_format(info, format_type) if info is not None else None
+            self._update_task(task_id, plan=plan['path'] if plan else 'default')
+            
             # Try download with primary configuration
             try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([url])
+                profile = f'download:{format_type}'
+                if pipeline:
+                    ydl_opts = self._fetch_only(ydl_opts)
+                    profile += ':fetch'
+                with self.ydl_pool.checkout(
+                    profile, ydl_opts,
+                    outtmpl=output_template(self.storage, video_id, format_type, FORMAT_QUALITY[format_type]),
+                    format=plan['format'] if plan else ydl_opts['format'],
+                    hooks=hooks
+                ) as ydl:
+                    self._run_download(ydl, url, info)
+                # ignoreerrors swallows failed downloads, an absent file is one
+                if not outputs:
+                    raise RuntimeError('Primary configuration produced no file')
             except Exception as e:
                 print(f"Primary download failed: {str(e)}")
                 # Try fallback with most basic configuration
-                self.progress_data[task_id]['status'] = 'retrying'
+                trace.close_all()
+                trace.start('fallback')
+                # The basic configuration produces a lower quality, which
+                # the task and the cache entry of its output must report
+                self._update_task(
+                    task_id, status='retrying', plan='fallback', fallback_reason=str(e),
+                    quality=FALLBACK_QUALITY[format_type]
+                )
                 
                 if format_type == 'mp3':
                     fallback_opts = {
                         'format': 'worst',  # Use worst quality for reliability
-                        'outtmpl': os.path.join(download_path, '%(title)s.%(ext)s'),
                         'postprocessors': [{
                             'key': 'FFmpegExtractAudio',
                             'preferredcodec': 'mp3',
                             'preferredquality': '128',  # Lower quality for reliability
                         }],
-                        'progress_hooks': [progress_hook],
-                        'postprocessor_hooks': [postprocessor_hook],
                         'noplaylist': True,
                         'extractaudio': True,
                         'ignoreerrors': True,
@@ -238,9 +521,6 @@ class YouTubeDownloader:
                 else:  # mp4
                     fallback_opts = {
                         'format': '18/worst',  # Format 18 is basic 360p mp4
-                        'outtmpl': os.path.join(download_path, '%(title)s.%(ext)s'),
-                        'progress_hooks': [progress_hook],
-                        'postprocessor_hooks': [postprocessor_hook],
                         'noplaylist': True,
                         'ignoreerrors': True,
                         'geo_bypass': True,
@@ -248,87 +528,535 @@ class YouTubeDownloader:
                     }
                 
                 print("Trying fallback download configuration...")
-                with yt_dlp.YoutubeDL(fallback_opts) as ydl:
-                    ydl.download([url])
+                profile = f'fallback:{format_type}'
+                if pipeline:
+                    fallback_opts = self._fetch_only(fallback_opts)
+                    profile += ':fetch'
+                    bitrate = '128'
+                with self.ydl_pool.checkout(
+                    profile, fallback_opts,
+                    outtmpl=output_template(self.storage, video_id, format_type, FALLBACK_QUALITY[format_type]),
+                    hooks=hooks
+                ) as ydl:
+                    self._run_download(ydl, url)
+                trace.end('fallback')
+                if not outputs:
+                    raise RuntimeError('Download produced no file')
+            
+            if pipeline:
+                return self._hand_off_transcode(task_id, bitrate, trace)
                 
         except Exception as e:
-            self.progress_data[task_id]['status'] = 'error'
-            self.progress_data[task_id]['error'] = str(e)
+            self._update_task(task_id, status='error', error=str(e))
+        return False
+    
+    def _run_download(self, ydl, url, info=None):
+        """Download a video with a checked-out YoutubeDL
+        
+        Without an info dict (batch items, resumed jobs, the fallback) the
+        page is extracted on the extract pool first, like any other
+        extraction: under gevent the download worker is a greenlet, and
+        the extractor's regex and JS work would stall the event loop.
+        """
+        if info is None:
+            info = self.extract_pool.submit(ydl.extract_info, url, download=False, process=False).result()
+            if info is None:
+                return  # ignoreerrors already reported it
+        ydl.process_ie_result(info, download=True)
+    
+    def _save_trace(self, task_id, trace):
+        """Store a copy of the task's spans on its record"""
+        self.tasks.update(task_id, spans=[dict(span) for span in trace.spans])
     
-    def _find_final_filename(self, task_id):
-        """Find the actual filename that was created"""
+    def _save_profile(self, task_id, profiler):
+        """Stop a task's profiler, write its stacks and summarize them on the task"""
+        profiler.stop()
+        path = None
         try:
-            progress = self.progress_data[task_id]
-            download_path = progress.get('download_path', '')
-            base_filename = progress.get('base_filename', '')
-            format_type = progress.get('format', 'mp3')
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f"{task_id}.folded")
+            profiler.write_folded(path)
+        except Exception as e:
+            print(f"Error writing profile for {task_id}: {e}")
+        self.tasks.update(task_id, profile={
+            'samples': profiler.samples,
+            'interval': profiler.interval,
+            'file': path,
+            'top': profiler.top()
+        })
+    
+    def record_span(self, task_id, name, started, duration):
+        """Add a span measured outside the download, e.g. serving the file"""
+        progress = self.tasks.get(task_id)
+        if progress is None:
+            return
+        trace = TaskTrace(origin=progress.get('created_at'), spans=progress.get('spans'))
+        trace.add(name, started, duration)
+        self._save_trace(task_id, trace)
+    
+    def _update_task(self, task_id, **fields):
+        """Update a task record and wake any progress streams watching it"""
+        self.tasks.update(task_id, **fields)
+        self.progress_events.notify(task_id)
+        if fields.get('status') in ('finished', 'error'):
+            self.progress_events.discard(task_id)
+            if task_id.startswith('download_'):
+                metrics.inc('ytdl_jobs_total', status=fields['status'])
+                self.journal.close(
+                    task_id, 'finished' if fields['status'] == 'finished' else 'failed',
+                    filename=fields.get('filename'), error=fields.get('error')
+                )
+    
+    def _fetch_only(self, ydl_opts):
+        """Strip the in-process audio extraction from a yt-dlp config"""
+        ydl_opts = dict(ydl_opts)
+        for key in ('postprocessors', 'extractaudio', 'audioformat', 'audioquality'):
+            ydl_opts.pop(key, None)
+        return ydl_opts
+    
+    def _hand_off_transcode(self, task_id, bitrate, trace):
+        """Queue the fetched audio on the transcode pool and free this worker
+        
+        Returns True once the encode is queued; the trace is then owned by
+        the completion callback.
+        """
+        progress = self.tasks.get(task_id) or {}
+        source_file = progress.get('source_file')
+        if not source_file or not os.path.exists(source_file):
+            self._update_task(task_id, status='error', error='Download produced no audio file')
+            return False
+        
+        target_file = os.path.splitext(source_file)[0] + '.mp3'
+        if source_file == target_file:
+            self._mark_finished(task_id, os.path.basename(target_file), trace)
+            return False
+        
+        self._update_task(task_id, status='transcoding', progress=96)
+        trace.start('transcode')
+        future = self.transcoder.submit(source_file, target_file, bitrate=bitrate)
+        future.add_done_callback(lambda f: self._on_transcoded(task_id, target_file, f, trace))
+        return True
+    
+    def _on_transcoded(self, task_id, target_file, future, trace):
+        """Record the outcome of a pipeline transcode"""
+        error = future.exception()
+        if error:
+            print(f"Transcode failed for {task_id}: {error}")
+            trace.close_all()
+            self._save_trace(task_id, trace)
+            self._update_task(task_id, status='error', error=str(error))
+        else:
+            self._mark_finished(task_id, os.path.basename(target_file), trace)
+    
+    def _mark_finished(self, task_id, filename, trace=None):
+        """Complete a task and make its output available to later requests"""
+        progress = self.tasks.get(task_id) or {}
+        if self.meta_store is not None:
+            self.meta_store.register(filename, task_id, progress.get('title'))
+        if self.locations is not None:
+            self.locations.record(filename)
+        fields = {}
+        # The file name tells which configuration made the output; a
+        # fallback output is cached under its own quality, so requests for
+        # the primary one never get it as a hit
+        cache_key = output_job_key(filename)
+        if cache_key is not None:
+            fields['quality'] = cache_key.rsplit(':', 1)[1]
+        else:
+            cache_key = progress.get('job_key')
+        if trace is not None:
+            # Spans land together with the status so a finished task is complete
+            trace.close_all()
+            fields['spans'] = [dict(span) for span in trace.spans]
+        self._update_task(task_id, status='finished', progress=100, filename=filename, **fields)
+        
+        if self.output_cache is not None and cache_key:
+            self.output_cache.put(cache_key, filename)
+    
+    def start_download(self, url, format_type, priority=0, local=False,
+                       cached_filename=None, check_cache=True):
+        """Queue a download on the worker pool
+        
+        A job for the same video, format and quality that is already queued
+        or running is reused instead of starting a second download. Raises
+        QueueFullError when the queue cannot take another job. With a
+        shared journal the job goes to the cluster queue, unless local is
+        set, and runs on whichever node has a free worker first. A caller
+        that already looked the output up passes its result as
+        cached_filename with check_cache=False.
+        """
+        task_id = f"download_{uuid.uuid4().hex}"
+        job_key = make_job_key(url, format_type)
+        
+        # Same video, format and bitrate already on disk: finish right away
+        if check_cache and self.output_cache is not None:
+            cached_filename = self.output_cache.lookup(job_key)
+        if cached_filename:
+            self.tasks.create(task_id, {
+                'status': 'finished',
+                'progress': 100,
+                'filename': cached_filename,
+                'error': None,
+                'format': format_type,
+                'quality': FORMAT_QUALITY.get(format_type),
+                'video_id': extract_video_id(url),
+                'job_key': job_key,
+                'cached': True,
+                'created_at': time.time()
+            })
+            metrics.inc('ytdl_jobs_total', status='cached')
+            return task_id
+        
+        record = {
+            'status': 'queued',
+            'progress': 0,
+            'filename': None,
+            'error': None,
+            'format': format_type,
+            'quality': FORMAT_QUALITY.get(format_type),
+            'video_id': extract_video_id(url),
+            'created_at': time.time()
+        }
+        if self.journal.shared and not local:
+            # Duplicates are caught by the cluster queue, which any node
+            # may take the job from; the record here answers polls until then
+            existing_id = self.journal.enqueue(
+                task_id, url, format_type, priority, job_key=job_key, owned=False
+            )
+            if existing_id:
+                return existing_id
+            self.tasks.create(task_id, dict(record, job_key=job_key))
+            return task_id
+        
+        # Create the record before queueing so a progress poll on any
+        # worker finds it immediately
+        existing_id = self.tasks.claim(job_key, task_id, record)
+        if existing_id:
+            return existing_id
+        
+        self.journal.enqueue(task_id, url, format_type, priority, job_key=job_key)
+        try:
+            self._submit(task_id, url, format_type, priority)
+        except Exception:
+            self.tasks.delete(task_id)
+            self.journal.delete(task_id)
+            raise
+        return task_id
+    
+    def _submit(self, task_id, url, format_type, priority):
+        """Put a journaled job on this process's worker pool"""
+        position = self.scheduler.submit(
+            task_id,
+            lambda: self.download_video(url, format_type, task_id),
+            format_type,
+            priority=priority
+        )
+        self._update_task(task_id, queue_position=position)
+    
+    def resume_interrupted(self, limit=None):
+        """Take over jobs whose worker died and queue them here again
+        
+        Output names are deterministic and yt-dlp continues a download
+        from its .part file, so a job interrupted mid-fetch only fetches
+        what is missing. A job interrupted max_attempts times is failed
+        and its partial files removed. With a shared journal this also
+        takes new jobs from the cluster queue, at most as many as this
+        process has idle workers. Returns the number of jobs queued.
+        """
+        if limit is None:
+            limit = self._idle_workers() if self.journal.shared else 50
+        if limit <= 0:
+            return 0
+        resumed = 0
+        for job in self.journal.orphaned(limit):
+            if not self.journal.adopt(job):
+                continue  # another worker took it
+            task_id = job['task_id']
+            url, format_type = job['url'], job['format']
             
-            if not base_filename or not download_path:
-                return
+            if self._ensure_task(task_id, url, format_type, job):
+                # The same output was requested again while this job had
+                # no owner; that job carries on instead
+                self.journal.close(task_id, 'failed')
+                continue
             
-            # Look for files with the base filename
-            for filename in os.listdir(download_path):
-                if filename.startswith(base_filename):
-                    # Check if it matches our expected format
-                    if format_type == 'mp3' and filename.endswith('.mp3'):
-                        self.progress_data[task_id]['filename'] = filename
-                        self.progress_data[task_id]['status'] = 'finished'
-                        return
-                    elif format_type == 'mp4' and filename.endswith('.mp4'):
-                        self.progress_data[task_id]['filename'] = filename
-                        self.progress_data[task_id]['status'] = 'finished'
-                        return
+            if job['attempts'] >= self.max_attempts:
+                self._remove_partials(url, format_type)
+                self._update_task(
+                    task_id, status='error',
+                    error=f"Download was interrupted {job['attempts']} times"
+                )
+                continue
             
-            # Fallback: look for any file with base filename
-            for filename in os.listdir(download_path):
-                if base_filename in filename:
-                    self.progress_data[task_id]['filename'] = filename
-                    self.progress_data[task_id]['status'] = 'finished'
-                    return
-                    
-        except Exception as e:
-            print(f"Error finding final filename: {e}")
-            self.progress_data[task_id]['status'] = 'error'
-            self.progress_data[task_id]['error'] = 'Could not locate final file'
+            # A resumed job starts over with the primary configuration
+            fields = {
+                'status': 'queued', 'progress': 0, 'error': None,
+                'quality': FORMAT_QUALITY.get(format_type)
+            }
+            if job['attempts']:
+                fields['resumed'] = job['attempts']
+            self._update_task(task_id, **fields)
+            try:
+                self._submit(task_id, url, format_type, job['priority'])
+            except QueueFullError:
+                self.journal.release(task_id)
+                break
+            if job['attempts']:
+                print(f"Resumed interrupted job {task_id} ({job['attempts']} earlier attempts)")
+            resumed += 1
+        return resumed
+    
+    def _ensure_task(self, task_id, url, format_type, job):
+        """Recreate the task record of a journaled job if it was lost
+        
+        Returns the id of another active task for the same output, or None.
+        """
+        if self.tasks.get(task_id) is not None:
+            return None
+        job_key = make_job_key(url, format_type)
+        record = {
+            'status': 'queued',
+            'progress': 0,
+            'filename': None,
+            'error': None,
+            'format': format_type,
+            'quality': FORMAT_QUALITY.get(format_type),
+            'video_id': extract_video_id(url),
+            'created_at': job['created_at']
+        }
+        if self.journal.shared:
+            # The cluster queue already made this the only job for its
+            # output, and local records of jobs that ran elsewhere are stale
+            self.tasks.create(task_id, dict(record, job_key=job_key))
+            return None
+        return self.tasks.claim(job_key, task_id, record)
+    
+    def _idle_workers(self):
+        stats = self.scheduler.stats()
+        return stats['workers'] - stats['queued'] - sum(stats['running'].values())
+    
+    def _pull_jobs(self):
+        """Adopt cluster jobs while this process has idle download workers"""
+        while True:
+            time.sleep(self.pull_interval)
+            try:
+                self.resume_interrupted()
+            except Exception as e:
+                print(f"Error pulling jobs: {e}")
+    
+    def _remove_partials(self, url, format_type):
+        """Delete the .part/.ytdl files a job left in its storage shard"""
+        video_id = extract_video_id(url)
+        for quality in (FORMAT_QUALITY[format_type], FALLBACK_QUALITY[format_type]):
+            stem = f'{video_id}-{format_type}-{quality}'
+            shard_dir = os.path.dirname(self.storage.path(stem))
+            for suffix in ('*.part', '*.part-Frag*', '*.ytdl'):
+                for path in glob.glob(os.path.join(glob.escape(shard_dir), glob.escape(stem) + suffix)):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+    
+    def expand_playlist(self, url, limit):
+        """Video URLs of a playlist (or the URL itself), at most limit"""
+        ydl_opts = {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': 'in_playlist',
+            'noplaylist': False,
+            'playlistend': limit,
+            'ignoreerrors': True,
+        }
+        def extract():
+            with self.ydl_pool.checkout(f'playlist:{limit}', ydl_opts) as ydl:
+                return ydl.extract_info(url, download=False)
+        
+        info = self.extract_pool.submit(extract).result()
+        if not info:
+            return []
+        if info.get('_type') != 'playlist':
+            return [url]
+        
+        urls = []
+        for entry in info.get('entries') or []:
+            if entry and entry.get('id'):
+                urls.append(f"https://www.youtube.com/watch?v={entry['id']}")
+        return urls[:limit]
     
-    def start_download(self, url, format_type, download_path):
-        """Start download in a separate thread"""
-        task_id = f"download_{int(time.time())}"
+    def start_batch(self, urls, format_type):
+        """Download many videos through the worker pool, returns a batch ID"""
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        self.tasks.create(batch_id, {
+            'kind': 'batch',
+            'status': 'running',
+            'format': format_type,
+            'items': [{'url': url, 'task_id': None, 'error': None} for url in urls],
+            'created_at': time.time()
+        })
         
         thread = threading.Thread(
-            target=self.download_video,
-            args=(url, format_type, download_path, task_id)
+            target=self._run_batch,
+            args=(batch_id, urls, format_type),
+            name=f"batch-{batch_id[-8:]}",
+            daemon=True
         )
-        thread.daemon = True
         thread.start()
+        return batch_id
+    
+    def _run_batch(self, batch_id, urls, format_type):
+        """Keep at most batch_parallelism items of a batch in the pool
         
-        self.download_threads[task_id] = thread
-        return task_id
+        The batch record is not an active job, so it is written at least
+        every quarter TTL to keep the task store from expiring it while the
+        last items are still running.
+        """
+        items = [{'url': url, 'task_id': None, 'error': None} for url in urls]
+        next_index = 0
+        in_flight = set()
+        refresh_interval = self.tasks.ttl_seconds / 4
+        refreshed = time.time()
+        
+        while next_index < len(items) or in_flight:
+            for i in list(in_flight):
+                status = self.get_progress(items[i]['task_id'])['status']
+                if status not in ACTIVE_STATUSES:
+                    in_flight.discard(i)
+            
+            submitted = False
+            while next_index < len(items) and len(in_flight) < self.batch_parallelism:
+                item = items[next_index]
+                try:
+                    # Batch items yield to interactive single downloads, and
+                    # stay on this node so the batch ZIP finds their files
+                    item['task_id'] = self.start_download(
+                        item['url'], format_type, priority=1, local=True
+                    )
+                    in_flight.add(next_index)
+                except QueueFullError:
+                    break
+                except Exception as e:
+                    item['error'] = str(e)
+                next_index += 1
+                submitted = True
+            
+            if submitted or time.time() - refreshed >= refresh_interval:
+                self._update_task(batch_id, items=items)
+                refreshed = time.time()
+            if next_index < len(items) or in_flight:
+                time.sleep(1)
+        
+        self._update_task(batch_id, status='finished')
     
-    def get_progress(self, task_id):
-        """Get download progress for a task"""
-        return self.progress_data.get(task_id, {
-            'status': 'not_found',
-            'progress': 0,
-            'filename': None,
-            'error': 'Task not found'
-        })
+    def get_batch(self, batch_id):
+        """Per-item and overall progress of a batch, or None"""
+        batch = self.tasks.get(batch_id)
+        if batch is None or batch.get('kind') != 'batch':
+            return None
+        
+        items = []
+        for item in batch['items']:
+            progress = self.get_progress(item['task_id']) if item['task_id'] else {}
+            if item['error']:
+                status = 'error'
+            else:
+                status = progress.get('status', 'pending')
+            items.append({
+                'url': item['url'],
+                'task_id': item['task_id'],
+                'status': status,
+                'progress': progress.get('progress', 0),
+                'filename': progress.get('filename'),
+                'error': item['error'] or progress.get('error')
+            })
+        
+        return {
+            'batch_id': batch_id,
+            'status': batch['status'],
+            'format': batch['format'],
+            'total': len(items),
+            'completed': sum(1 for i in items if i['status'] == 'finished'),
+            'failed': sum(1 for i in items if i['status'] in ('error', 'not_found')),
+            'progress': sum(i['progress'] or 0 for i in items) / len(items) if items else 100,
+            'items': items
+        }
     
-    def cleanup_old_progress(self, max_age_hours=24):
-        """Clean up old progress data"""
-        current_time = time.time()
-        to_remove = []
+    def stream_mp3(self, url, on_complete=None):
+        """Encode a video's audio to MP3 while it downloads
         
-        for task_id in self.progress_data:
-            # Extract timestamp from task_id
-            try:
-                task_time = int(task_id.split('_')[1])
-                if current_time - task_time > max_age_hours * 3600:
-                    to_remove.append(task_id)
-            except:
-                continue
+        Returns (filename, title, chunks) where chunks yields MP3 bytes as
+        ffmpeg produces them. The finished file is kept in storage and
+        added to the output cache. Raises ValueError with a user-facing
+        message when the video has no usable audio stream.
+        """
+        info, error_msg = self._extract_info(url)
+        if info is None:
+            raise ValueError(error_msg)
+        
+        audio_format = select_audio_format(info)
+        if audio_format is None:
+            raise ValueError('No streamable audio format found for this video')
         
-        for task_id in to_remove:
-            del self.progress_data[task_id]
-            if task_id in self.download_threads:
-                del self.download_threads[task_id]
+        outtmpl = output_template(self.storage, info['id'], 'mp3', FORMAT_QUALITY['mp3'])
+        with self.ydl_pool.checkout('naming', {}, outtmpl=outtmpl) as ydl:
+            target_path = ydl.prepare_filename(dict(info, ext='mp3'))
+        filename = os.path.basename(target_path)
+        job_key = make_job_key(url, 'mp3')
+        
+        def finished(path):
+            if self.meta_store is not None:
+                self.meta_store.register(filename, None, info.get('title'))
+            if self.locations is not None:
+                self.locations.record(filename)
+            if self.output_cache is not None:
+                self.output_cache.put(job_key, filename)
+            if on_complete:
+                on_complete(filename)
+        
+        chunks = self.stream_transcoder.stream(
+            audio_format['url'],
+            audio_format.get('http_headers') or {},
+            target_path,
+            bitrate=FORMAT_QUALITY['mp3'],
+            on_complete=finished
+        )
+        return filename, info.get('title'), chunks
+    
+    def get_progress(self, task_id):
+        """Get download progress for a task
+        
+        A cluster job held by another node is summarized from the shared
+        queue; its full record is on that node.
+        """
+        if self.journal.shared:
+            job = self.journal.get(task_id)
+            if self.journal.remote_url(job):
+                return self._remote_progress(job)
+        progress = self.tasks.get(task_id)
+        if progress is None:
+            return {
+                'status': 'not_found',
+                'progress': 0,
+                'filename': None,
+                'error': 'Task not found'
+            }
+        
+        # The pool that holds the job knows its live position
+        if progress.get('status') == 'queued':
+            position = self.scheduler.position(task_id)
+            if position is not None:
+                progress['queue_position'] = position
+        return progress
+    
+    def _remote_progress(self, job):
+        """Progress of a job on another node, as far as the queue knows it"""
+        status = {'queued': 'queued', 'running': 'downloading', 'finished': 'finished'}.get(
+            job['state'], 'error'
+        )
+        return {
+            'status': status,
+            'progress': 100 if status == 'finished' else 0,
+            'filename': job['filename'],
+            'error': job['error'],
+            'format': job['format'],
+            'node': job['node_id'],
+        }
@@ -0,0 +1,51 @@
+import time
+
+
+class FileLocations:
+    """Which node holds each finished file, kept next to the shared job queue
+
+    Files stay on the disk of the node that produced them. Every node
+    records its outputs here and forgets them when cleanup removes them,
+    so a node asked for a file it doesn't have can send the client to
+    one that does.
+    """
+
+    def __init__(self, journal):
+        # Same database, node id and URL as the job queue
+        self.db = journal.db
+        self.node_id = journal.host
+        self.node_url = journal.node_url
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS file_locations (
+                filename TEXT NOT NULL,
+                node_id TEXT NOT NULL,
+                node_url TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (filename, node_id)
+            );
+        ''')
+
+    def record(self, filename):
+        """Note that this node holds filename"""
+        self.db.execute(
+            'INSERT OR REPLACE INTO file_locations (filename, node_id, node_url, updated_at) '
+            'VALUES (?, ?, ?, ?)',
+            (filename, self.node_id, self.node_url, time.time())
+        )
+
+    def forget(self, filenames):
+        """Note that this node no longer holds the given files"""
+        with self.db.transaction() as conn:
+            conn.executemany(
+                'DELETE FROM file_locations WHERE filename = ? AND node_id = ?',
+                [(f, self.node_id) for f in filenames]
+            )
+
+    def remote_url(self, filename):
+        """Base URL of another node holding filename, most recent first, or None"""
+        row = self.db.execute(
+            'SELECT node_url FROM file_locations WHERE filename = ? AND node_id != ? '
+            'AND node_url IS NOT NULL ORDER BY updated_at DESC LIMIT 1',
+            (filename, self.node_id)
+        ).fetchone()
+        return row['node_url'] if row else None
@@ -0,0 +1,71 @@
+def _has_audio(f):
+    return f.get('acodec') not in (None, 'none')
+
+
+def _has_video(f):
+    return f.get('vcodec') not in (None, 'none')
+
+
+def _codec(f, key):
+    return (f.get(key) or '').split('.')[0].lower()
+
+
+def _best(formats, key):
+    return max(formats, key=key) if formats else None
+
+
+def plan_format(info, format_type, max_height=720):
+    """Choose the source format that needs the least ffmpeg work
+
+    Returns a dict with the yt-dlp 'format' selector and the 'path' taken:
+
+    - mp3 'copy': an MP3 stream exists, extraction copies it as is
+    - mp3 'transcode': best audio stream, re-encoded to MP3
+    - mp4 'direct': a progressive MP4 (video and audio in one file)
+    - mp4 'remux': H.264 video + AAC audio merged without re-encoding
+    Returns None when the info dict has no usable format list, so the caller
+    keeps its generic format string.
+    """
+    formats = [f for f in info.get('formats') or [] if f.get('format_id') and f.get('url')]
+    if not formats:
+        return None
+
+    if format_type == 'mp3':
+        audio_only = [f for f in formats if _has_audio(f) and not _has_video(f)]
+        audio_rate = lambda f: (f.get('abr') or f.get('tbr') or 0)
+
+        mp3_source = _best([f for f in audio_only if _codec(f, 'acodec') == 'mp3'], audio_rate)
+        if mp3_source:
+            return {'path': 'copy', 'format': mp3_source['format_id']}
+
+        audio = _best(audio_only, audio_rate)
+        if audio:
+            return {'path': 'transcode', 'format': audio['format_id']}
+        return None
+
+    def fits(f):
+        return (f.get('height') or 0) <= max_height
+    video_rank = lambda f: (f.get('height') or 0, f.get('tbr') or 0)
+
+    progressive = _best([
+        f for f in formats
+        if _has_video(f) and _has_audio(f) and f.get('ext') == 'mp4' and fits(f)
+    ], video_rank)
+    if progressive and (progressive.get('height') or 0) >= 360:
+        return {'path': 'direct', 'format': progressive['format_id']}
+
+    video = _best([
+        f for f in formats
+        if _has_video(f) and not _has_audio(f) and f.get('ext') == 'mp4'
+        and _codec(f, 'vcodec') in ('avc1', 'h264') and fits(f)
+    ], video_rank)
+    audio = _best([
+        f for f in formats
+        if _has_audio(f) and not _has_video(f) and _codec(f, 'acodec') in ('mp4a', 'aac')
+    ], lambda f: f.get('abr') or f.get('tbr') or 0)
+    if video and audio and (video.get('height') or 0) > ((progressive or {}).get('height') or 0):
+        return {'path': 'remux', 'format': f"{video['format_id']}+{audio['format_id']}"}
+
+    if progressive:
+        return {'path': 'direct', 'format': progressive['format_id']}
+    return None
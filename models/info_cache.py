@@ -0,0 +1,92 @@
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from models.db import Database
+from models.metrics import metrics
+
+
+class InfoCache:
+    """TTL + LRU cache of extracted yt-dlp info dicts, keyed by video ID
+
+    A small in-process LRU sits in front of a table in the shared SQLite
+    database, so a lookup done by one worker serves every other worker.
+    Entries are stored as compressed JSON and every get returns a fresh
+    copy, since yt-dlp mutates the info dict it processes.
+    """
+
+    def __init__(self, ttl_seconds=None, max_entries=None, local_entries=128, db=None):
+        # Stream URLs inside the info dict expire after a few hours
+        self.ttl_seconds = ttl_seconds or int(os.getenv('INFO_CACHE_TTL', 3600))
+        self.max_entries = max_entries or int(os.getenv('INFO_CACHE_MAX_ENTRIES', 2000))
+        self.local_entries = local_entries
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self.db = db or Database()
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS info_cache (
+                video_id TEXT PRIMARY KEY,
+                info BLOB NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_info_cache_last_access ON info_cache(last_access);
+        ''')
+
+    def get(self, video_id):
+        """Return a copy of the cached info dict, or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._local.get(video_id)
+            if entry is not None:
+                if entry[0] > now:
+                    self._local.move_to_end(video_id)
+                    metrics.inc('ytdl_cache_requests_total', cache='info', result='hit')
+                    return self._decode(entry[1])
+                del self._local[video_id]
+
+        row = self.db.execute(
+            'SELECT info, expires_at FROM info_cache WHERE video_id = ? AND expires_at > ?',
+            (video_id, now)
+        ).fetchone()
+        if row is None:
+            metrics.inc('ytdl_cache_requests_total', cache='info', result='miss')
+            return None
+
+        metrics.inc('ytdl_cache_requests_total', cache='info', result='hit')
+        self.db.execute(
+            'UPDATE info_cache SET last_access = ? WHERE video_id = ?', (now, video_id)
+        )
+        self._remember(video_id, row['expires_at'], row['info'])
+        return self._decode(row['info'])
+
+    def put(self, video_id, info):
+        """Cache a sanitized (JSON serializable) info dict"""
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        blob = zlib.compress(json.dumps(info).encode('utf-8'))
+        self.db.execute(
+            'INSERT OR REPLACE INTO info_cache (video_id, info, expires_at, last_access) '
+            'VALUES (?, ?, ?, ?)',
+            (video_id, blob, expires_at, now)
+        )
+        # Trim expired rows and the least recently used overflow
+        self.db.execute('DELETE FROM info_cache WHERE expires_at <= ?', (now,))
+        self.db.execute(
+            'DELETE FROM info_cache WHERE video_id IN ('
+            'SELECT video_id FROM info_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+        self._remember(video_id, expires_at, blob)
+
+    def _remember(self, video_id, expires_at, blob):
+        with self._lock:
+            self._local[video_id] = (expires_at, blob)
+            self._local.move_to_end(video_id)
+            while len(self._local) > self.local_entries:
+                self._local.popitem(last=False)
+
+    def _decode(self, blob):
+        return json.loads(zlib.decompress(blob))
@@ -0,0 +1,240 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from models.db import Database
+from models.maintenance import pid_alive
+
+# Journal states; queued and running jobs have an owning process
+OPEN_STATES = ('queued', 'running')
+
+
+class JobJournal:
+    """Durable record of every download job and the process that owns it
+
+    The scheduler's queue and worker threads live in one process, so a
+    recycled or killed worker takes its jobs with it. Each job is written
+    here when it is queued, marked running when a worker picks it up and
+    closed when it finishes or fails. Owners refresh a heartbeat on their
+    open jobs; a job whose owner has exited (same host) or stopped
+    heartbeating for lease_seconds is orphaned, and adopt() hands it to a
+    new owner atomically so only one process resumes it.
+
+    With shared=True the database is the job queue of several nodes: jobs
+    are queued without an owner, every node adopts them as it has room,
+    and node_id/node_url of each job name the node holding its progress
+    and output.
+    """
+
+    def __init__(self, db=None, lease_seconds=None, heartbeat_interval=None, retention_seconds=None,
+                 shared=False, node_id=None, node_url=None):
+        self.db = db or Database()
+        self.shared = shared
+        self.lease_seconds = lease_seconds or float(os.getenv('JOB_LEASE_SECONDS', 120))
+        self.heartbeat_interval = heartbeat_interval or self.lease_seconds / 4
+        # Closed jobs are kept as long as task records
+        self.retention_seconds = retention_seconds or float(os.getenv('TASK_TTL_SECONDS', 3600))
+        # Owners are identified by a token drawn when the process starts: a
+        # restarted container keeps its hostname (or NODE_ID), data volume
+        # and often its worker pids, so node and pid alone could make a new
+        # worker mistake a dead one's jobs for its own. The pid is only used
+        # to notice sooner that an owner on this node has exited
+        self.host = node_id or os.getenv('NODE_ID') or socket.gethostname()
+        self.node_url = (node_url or os.getenv('NODE_URL') or '').rstrip('/') or None
+        self.pid = os.getpid()
+        self.token = uuid.uuid4().hex
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                task_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                format TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                state TEXT NOT NULL,
+                owner_host TEXT,
+                owner_pid INTEGER,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                heartbeat_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state, heartbeat_at);
+        ''')
+        self._add_columns()
+        self._heartbeat = threading.Thread(target=self._beat, name='job-heartbeat', daemon=True)
+        self._heartbeat.start()
+
+    def _add_columns(self):
+        """Add columns introduced after the table was first created"""
+        columns = [row['name'] for row in self.db.execute('PRAGMA table_info(jobs)')]
+        try:
+            # Node holding the job's progress and output, kept once it closes
+            for name in ('job_key', 'node_id', 'node_url', 'filename', 'error', 'owner_token'):
+                if name not in columns:
+                    self.db.execute(f'ALTER TABLE jobs ADD COLUMN {name} TEXT')
+        except sqlite3.OperationalError:
+            pass  # another process added them first
+        self.db.execute(
+            'CREATE INDEX IF NOT EXISTS idx_jobs_job_key ON jobs(job_key, state)'
+        )
+
+    def enqueue(self, task_id, url, format_type, priority=0, job_key=None, owned=True):
+        """Record a new job, returns None or the id of an open duplicate
+
+        An owned job is queued in this process, which already checked its
+        task store for duplicates. An unowned one waits for any node to
+        adopt it (progress polls go to this node until then, it holds the
+        queued task record) and is only recorded if no open job has the
+        same key; the check and insert share one transaction, so two nodes
+        can't queue the same output twice.
+        """
+        now = time.time()
+        placeholders = ', '.join('?' for _ in OPEN_STATES)
+        with self.db.transaction() as conn:
+            if not owned and job_key is not None:
+                row = conn.execute(
+                    f'SELECT task_id FROM jobs WHERE job_key = ? AND state IN ({placeholders}) LIMIT 1',
+                    (job_key, *OPEN_STATES)
+                ).fetchone()
+                if row:
+                    return row['task_id']
+            conn.execute(
+                'INSERT OR REPLACE INTO jobs (task_id, url, format, priority, state, owner_host, '
+                'owner_pid, owner_token, created_at, updated_at, heartbeat_at, job_key, node_id, '
+                'node_url) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (task_id, url, format_type, priority, 'queued',
+                 self.host if owned else None, self.pid if owned else None,
+                 self.token if owned else None,
+                 now, now, now if owned else 0, job_key, self.host, self.node_url)
+            )
+        return None
+
+    def start(self, task_id):
+        """Mark a job running and count the attempt"""
+        now = time.time()
+        self.db.execute(
+            "UPDATE jobs SET state = 'running', attempts = attempts + 1, updated_at = ?, "
+            'heartbeat_at = ? WHERE task_id = ?',
+            (now, now, task_id)
+        )
+
+    def close(self, task_id, state, filename=None, error=None):
+        """Record the final state, 'finished' or 'failed', and its outcome"""
+        self.db.execute(
+            'UPDATE jobs SET state = ?, owner_host = NULL, owner_pid = NULL, owner_token = NULL, '
+            'updated_at = ?, filename = ?, error = ? WHERE task_id = ?',
+            (state, time.time(), filename, error, task_id)
+        )
+
+    def get(self, task_id):
+        row = self.db.execute('SELECT * FROM jobs WHERE task_id = ?', (task_id,)).fetchone()
+        return dict(row) if row else None
+
+    def delete(self, task_id):
+        self.db.execute('DELETE FROM jobs WHERE task_id = ?', (task_id,))
+
+    def orphaned(self, limit=50):
+        """Unowned jobs and those whose owner exited or whose lease ran out
+
+        Ordered like the scheduler queue: priority, then oldest first. An
+        owner on this node with this process's pid but another token ran
+        before a restart and is gone.
+        """
+        placeholders = ', '.join('?' for _ in OPEN_STATES)
+        rows = self.db.execute(
+            f'SELECT * FROM jobs WHERE state IN ({placeholders}) ORDER BY priority, created_at',
+            OPEN_STATES
+        ).fetchall()
+        lease_cutoff = time.time() - self.lease_seconds
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            if job['owner_token'] is not None and job['owner_token'] == self.token:
+                continue
+            same_host = job['owner_host'] == self.host and job['owner_pid']
+            exited = same_host and (job['owner_pid'] == self.pid or not pid_alive(job['owner_pid']))
+            if exited or job['heartbeat_at'] < lease_cutoff:
+                jobs.append(job)
+                if len(jobs) >= limit:
+                    break
+        return jobs
+
+    def adopt(self, job):
+        """Take over an orphaned job, False if another process got it first"""
+        now = time.time()
+        cursor = self.db.execute(
+            "UPDATE jobs SET state = 'queued', owner_host = ?, owner_pid = ?, owner_token = ?, "
+            'updated_at = ?, heartbeat_at = ?, node_id = ?, node_url = ? WHERE task_id = ? '
+            'AND state = ? AND owner_token IS ? AND heartbeat_at = ?',
+            (self.host, self.pid, self.token, now, now, self.host, self.node_url, job['task_id'],
+             job['state'], job['owner_token'], job['heartbeat_at'])
+        )
+        return cursor.rowcount == 1
+
+    def remote_url(self, job):
+        """Base URL of the node holding a job, None if that is this node"""
+        if job is None or job.get('node_id') in (None, self.host):
+            return None
+        return job.get('node_url')
+
+    def release(self, task_id):
+        """Give an adopted job back, e.g. when the local queue is full
+
+        It stays queued without an owner and is orphaned for the next pass.
+        """
+        self.db.execute(
+            'UPDATE jobs SET owner_host = NULL, owner_pid = NULL, owner_token = NULL, '
+            'heartbeat_at = 0 WHERE task_id = ? AND owner_token = ?',
+            (task_id, self.token)
+        )
+
+    def purge(self):
+        """Delete closed jobs past the retention period"""
+        placeholders = ', '.join('?' for _ in OPEN_STATES)
+        cursor = self.db.execute(
+            f'DELETE FROM jobs WHERE state NOT IN ({placeholders}) AND updated_at < ?',
+            (*OPEN_STATES, time.time() - self.retention_seconds)
+        )
+        return cursor.rowcount
+
+    def stats(self):
+        """Job counts by state"""
+        rows = self.db.execute('SELECT state, COUNT(*) AS n FROM jobs GROUP BY state').fetchall()
+        return {row['state']: row['n'] for row in rows}
+
+    def _beat(self):
+        placeholders = ', '.join('?' for _ in OPEN_STATES)
+        while True:
+            time.sleep(self.heartbeat_interval)
+            try:
+                self.db.execute(
+                    f'UPDATE jobs SET heartbeat_at = ? WHERE owner_token = ? '
+                    f'AND state IN ({placeholders})',
+                    (time.time(), self.token, *OPEN_STATES)
+                )
+            except Exception as e:
+                print(f"Error refreshing job heartbeat: {e}")
+
+
+def create_job_journal():
+    """Build the job journal selected by the JOB_QUEUE env var
+
+    "local" keeps jobs in the state database of this node. "sqlite" shares
+    one queue between nodes through the SQLite file at JOB_QUEUE_PATH (on
+    a volume every node mounts, and only for a few nodes on one host:
+    SQLite locking is not safe over network filesystems). Another backend
+    only needs the methods of JobJournal.
+    """
+    backend = os.getenv('JOB_QUEUE', 'local').lower()
+    if backend == 'local':
+        return JobJournal()
+    if backend == 'sqlite':
+        path = os.getenv('JOB_QUEUE_PATH')
+        if not path:
+            raise ValueError('JOB_QUEUE=sqlite needs JOB_QUEUE_PATH')
+        journal = JobJournal(Database(path), shared=True)
+        if journal.node_url is None:
+            print('Warning: NODE_URL is not set, other nodes cannot send requests for this node\'s jobs here')
+        return journal
+    raise ValueError(f"Unknown JOB_QUEUE backend: {backend}")
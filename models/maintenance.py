@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+from models.db import get_db_path
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, every process runs maintenance
+    fcntl = None
+
+
+def pid_alive(pid):
+    """Whether a process with this pid exists on this host"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # exists, owned by someone else
+    return True
+
+
+class MaintenanceRunner:
+    """Runs periodic jobs in exactly one process per host
+
+    Every worker starts a runner, and each runner tries to take an
+    exclusive flock on lock_path. The one that gets it becomes the leader
+    and runs the jobs every interval seconds. The lock belongs to the open
+    file, so the kernel releases it when the leader exits or is killed,
+    and one of the others takes over on its next attempt.
+    """
+
+    def __init__(self, jobs, interval=None, lock_path=None, retry_interval=30, on_elected=None):
+        # jobs: list of (name, callable); each call is isolated from the others
+        self.jobs = list(jobs)
+        self.interval = interval or float(os.getenv('CLEANUP_INTERVAL_SECONDS', 60))
+        self.lock_path = lock_path or os.getenv('MAINTENANCE_LOCK_PATH') or os.path.join(
+            os.path.dirname(get_db_path()) or '.', 'maintenance.lock'
+        )
+        self.retry_interval = retry_interval
+        # Called once when this process becomes the leader
+        self.on_elected = on_elected
+        self.leader = False
+        self._lock_file = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True, name='maintenance')
+            self._thread.start()
+        return self
+
+    def _try_elect(self):
+        if fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+        lock_file = open(self.lock_path, 'a+')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        # Only informative, the lock itself is what counts
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(f'{os.getpid()}\n')
+        lock_file.flush()
+        self._lock_file = lock_file
+        return True
+
+    def _run(self):
+        while not self.leader:
+            try:
+                self.leader = self._try_elect()
+            except Exception as e:
+                print(f"Error taking maintenance lock: {e}")
+            if not self.leader:
+                time.sleep(self.retry_interval)
+
+        print(f"Process {os.getpid()} runs background maintenance")
+        if self.on_elected is not None:
+            try:
+                self.on_elected()
+            except Exception as e:
+                print(f"Error in maintenance setup: {e}")
+
+        while True:
+            time.sleep(self.interval)
+            for name, job in self.jobs:
+                try:
+                    job()
+                except Exception as e:
+                    print(f"Error in maintenance job {name}: {e}")
+
+    def stats(self):
+        return {'leader': self.leader, 'pid': os.getpid(), 'lock_path': self.lock_path}
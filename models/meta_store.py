@@ -0,0 +1,230 @@
+import json
+import os
+import sqlite3
+import time
+from models.db import Database
+
+
+class MetaStore:
+    """Per-file download metadata in the shared SQLite database
+
+    Replaces the .downloads_meta.json file: every change is a single-row
+    statement, so concurrent workers never overwrite each other, and the
+    expires_at index lets cleanup pick the next files due without looking
+    at the rest, no matter how many files are tracked. Totals for
+    /api/stats are kept in a one-row table that triggers update with
+    every change, so reading them doesn't scan the table either.
+    """
+
+    def __init__(self, db=None, ttl_seconds=None, download_grace_seconds=3600):
+        self.db = db or Database()
+        # Files expire ttl_seconds after they are created, and never less
+        # than download_grace_seconds after their last download
+        self.ttl_seconds = ttl_seconds or float(os.getenv('FILE_TTL_HOURS', 24)) * 3600
+        self.download_grace_seconds = download_grace_seconds
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS downloads (
+                filename TEXT PRIMARY KEY,
+                task_id TEXT,
+                created_at REAL NOT NULL,
+                downloaded INTEGER NOT NULL DEFAULT 0,
+                download_count INTEGER NOT NULL DEFAULT 0,
+                last_download REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_downloads_created_at ON downloads(created_at);
+            CREATE INDEX IF NOT EXISTS idx_downloads_last_download ON downloads(last_download);
+        ''')
+        self._add_columns()
+        self._add_totals()
+
+    def _add_columns(self):
+        """Add columns introduced after the table was first created"""
+        columns = [row['name'] for row in self.db.execute('PRAGMA table_info(downloads)')]
+        try:
+            if 'expires_at' not in columns:
+                self.db.execute('ALTER TABLE downloads ADD COLUMN expires_at REAL')
+                self.db.execute(
+                    'UPDATE downloads SET expires_at = created_at + ? WHERE expires_at IS NULL',
+                    (self.ttl_seconds,)
+                )
+            if 'title' not in columns:
+                # Human-readable name, only used for Content-Disposition
+                self.db.execute('ALTER TABLE downloads ADD COLUMN title TEXT')
+        except sqlite3.OperationalError:
+            pass  # another worker added them first
+        self.db.execute(
+            'CREATE INDEX IF NOT EXISTS idx_downloads_expires_at ON downloads(expires_at)'
+        )
+
+    def _add_totals(self):
+        """Create the totals row and the triggers that keep it current
+
+        A database from before the totals existed is counted once, in the
+        same transaction that adds the triggers, so no change is missed.
+        """
+        with self.db.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS download_totals (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    total_files INTEGER NOT NULL,
+                    downloaded_files INTEGER NOT NULL,
+                    total_downloads INTEGER NOT NULL
+                )
+            ''')
+            if conn.execute('SELECT 1 FROM download_totals').fetchone() is None:
+                conn.execute(
+                    'INSERT INTO download_totals SELECT 1, COUNT(*), '
+                    'COALESCE(SUM(downloaded), 0), COALESCE(SUM(download_count), 0) FROM downloads'
+                )
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS downloads_totals_insert AFTER INSERT ON downloads
+                BEGIN
+                    UPDATE download_totals SET total_files = total_files + 1,
+                        downloaded_files = downloaded_files + NEW.downloaded,
+                        total_downloads = total_downloads + NEW.download_count;
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS downloads_totals_update
+                AFTER UPDATE OF downloaded, download_count ON downloads
+                BEGIN
+                    UPDATE download_totals SET
+                        downloaded_files = downloaded_files + NEW.downloaded - OLD.downloaded,
+                        total_downloads = total_downloads + NEW.download_count - OLD.download_count;
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS downloads_totals_delete AFTER DELETE ON downloads
+                BEGIN
+                    UPDATE download_totals SET total_files = total_files - 1,
+                        downloaded_files = downloaded_files - OLD.downloaded,
+                        total_downloads = total_downloads - OLD.download_count;
+                END
+            ''')
+
+    def register(self, filename, task_id, title=None):
+        """Record a completed download
+
+        Output names are deterministic, so a file produced again after its
+        row already exists just gets a fresh expiry.
+        """
+        now = time.time()
+        self.db.execute(
+            'INSERT INTO downloads (filename, task_id, created_at, expires_at, title) '
+            'VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(filename) DO UPDATE SET task_id = COALESCE(excluded.task_id, task_id), '
+            'title = COALESCE(excluded.title, title), '
+            'expires_at = MAX(COALESCE(expires_at, 0), excluded.expires_at)',
+            (filename, task_id, now, now + self.ttl_seconds, title)
+        )
+
+    def get(self, filename):
+        """Metadata for one file, or None"""
+        row = self.db.execute(
+            'SELECT * FROM downloads WHERE filename = ?', (filename,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def record_download(self, filename):
+        """Atomically count one more download of a file"""
+        now = time.time()
+        self.db.execute(
+            'UPDATE downloads SET downloaded = 1, download_count = download_count + 1, '
+            'last_download = ?, expires_at = MAX(COALESCE(expires_at, 0), ?) WHERE filename = ?',
+            (now, now + self.download_grace_seconds, filename)
+        )
+
+    def expired(self, now, limit):
+        """Up to limit files whose expiry has passed, soonest first"""
+        rows = self.db.execute(
+            'SELECT filename FROM downloads WHERE expires_at <= ? ORDER BY expires_at LIMIT ?',
+            (now, limit)
+        ).fetchall()
+        return [row['filename'] for row in rows]
+
+    def extend(self, filename, expires_at):
+        """Push a file's expiry back, e.g. while it is still being served"""
+        self.db.execute(
+            'UPDATE downloads SET expires_at = MAX(COALESCE(expires_at, 0), ?) WHERE filename = ?',
+            (expires_at, filename)
+        )
+
+    def least_recently_used(self, limit, exclude=()):
+        """Files ordered by last download (or creation), oldest first"""
+        rows = self.db.execute(
+            'SELECT filename, created_at, last_download FROM downloads '
+            'ORDER BY COALESCE(last_download, created_at) LIMIT ?',
+            (limit + len(exclude),)
+        ).fetchall()
+        return [row['filename'] for row in rows if row['filename'] not in exclude][:limit]
+
+    def contains(self, filename):
+        """Whether a file is tracked"""
+        return self.db.execute(
+            'SELECT 1 FROM downloads WHERE filename = ?', (filename,)
+        ).fetchone() is not None
+
+    def delete(self, filenames):
+        """Forget the given files"""
+        with self.db.transaction() as conn:
+            conn.executemany(
+                'DELETE FROM downloads WHERE filename = ?', [(f,) for f in filenames]
+            )
+
+    def stats(self):
+        """Aggregate counters over all tracked files, read from one row"""
+        row = self.db.execute(
+            'SELECT total_files, downloaded_files, total_downloads FROM download_totals'
+        ).fetchone()
+        return dict(row)
+
+    def page(self, after=None, limit=100):
+        """Up to limit files ordered by name, starting after the given one
+
+        Keyset pagination on the primary key: each page costs the same no
+        matter how deep into the listing it is.
+        """
+        rows = self.db.execute(
+            'SELECT filename, title, created_at, expires_at, download_count, last_download '
+            'FROM downloads WHERE filename > ? ORDER BY filename LIMIT ?',
+            (after or '', limit)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def migrate_json(self, json_path):
+        """One-time import of the legacy .downloads_meta.json file"""
+        if not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, 'r') as f:
+                meta = json.load(f)
+        except Exception as e:
+            print(f"Error reading legacy meta file: {e}")
+            return 0
+
+        with self.db.transaction() as conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO downloads '
+                '(filename, task_id, created_at, downloaded, download_count, last_download, expires_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (
+                        filename,
+                        m.get('task_id'),
+                        m.get('created_at', time.time()),
+                        1 if m.get('downloaded') else 0,
+                        m.get('download_count', 0),
+                        m.get('last_download'),
+                        m.get('created_at', time.time()) + self.ttl_seconds,
+                    )
+                    for filename, m in meta.items()
+                ]
+            )
+
+        # Another worker may have migrated and renamed it first
+        try:
+            os.replace(json_path, json_path + '.migrated')
+        except FileNotFoundError:
+            pass
+        print(f"Migrated {len(meta)} entries from {json_path}")
+        return len(meta)
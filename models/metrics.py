@@ -0,0 +1,252 @@
+import json
+import math
+import os
+import threading
+import time
+from models.db import Database
+from models.maintenance import pid_alive
+
+# Seconds-scale buckets for extraction, postprocessing and transcoding
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Bytes/sec buckets for download throughput (100 KB/s .. 100 MB/s)
+THROUGHPUT_BUCKETS = (1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 2.5e7, 5e7, 1e8)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    'ytdl_extraction_seconds': (
+        'histogram', 'Info extraction latency per strategy config', DURATION_BUCKETS),
+    'ytdl_download_bytes_total': (
+        'counter', 'Bytes fetched from the source by download jobs', None),
+    'ytdl_download_throughput_bytes_per_second': (
+        'histogram', 'Average fetch throughput of finished downloads', THROUGHPUT_BUCKETS),
+    'ytdl_postprocess_seconds': (
+        'histogram', 'Duration of yt-dlp postprocessors (ffmpeg extraction, merging)', DURATION_BUCKETS),
+    'ytdl_transcode_seconds': (
+        'histogram', 'Duration of MP3 encodes on the transcode pool', DURATION_BUCKETS),
+    'ytdl_jobs_total': (
+        'counter', 'Download jobs by final status', None),
+    'ytdl_cache_requests_total': (
+        'counter', 'Output and info cache lookups by result', None),
+    'ytdl_served_bytes_total': (
+        'counter', 'Bytes of finished files sent to clients', None),
+    'ytdl_files_served_total': (
+        'counter', 'File responses sent to clients', None),
+    'ytdl_queue_depth': (
+        'gauge', 'Jobs waiting in the download queue', None),
+    'ytdl_jobs_running': (
+        'gauge', 'Jobs currently running on download workers', None),
+}
+
+
+def _label_key(labels):
+    return json.dumps(labels, sort_keys=True) if labels else ''
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in labels.items()
+    )
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class MetricsRegistry:
+    """Counters, gauges and histograms updated from the hot paths
+
+    Updates only touch an in-process dict. Every flush_interval seconds
+    (and before each scrape) the process writes its series to the shared
+    SQLite database, and render() sums the series of all workers, so
+    /metrics gives the same answer whichever worker handles the scrape.
+    Gauges of a process that stopped flushing are ignored.
+    """
+
+    def __init__(self, db=None, flush_interval=5):
+        self._db = db
+        self.flush_interval = flush_interval
+        self._series = {}
+        self._gauge_callbacks = {}
+        self._lock = threading.Lock()
+        self._next_flush = 0.0
+        self._table_ready = False
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = Database()
+        if not self._table_ready:
+            self._db.executescript('''
+                CREATE TABLE IF NOT EXISTS metrics (
+                    pid INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    labels TEXT NOT NULL,
+                    value REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (pid, name, labels)
+                );
+            ''')
+            self._table_ready = True
+        return self._db
+
+    def inc(self, name, value=1, **labels):
+        """Add value to a counter"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + value
+        self._maybe_flush()
+
+    def observe(self, name, value, **labels):
+        """Record one histogram observation"""
+        buckets = METRICS[name][2]
+        with self._lock:
+            if (f'{name}_count', _label_key(labels)) not in self._series:
+                self._init_histogram(name, labels)
+            for bound in buckets + (math.inf,):
+                if value <= bound:
+                    key = (f'{name}_bucket', _label_key(dict(labels, le=_format_value(bound))))
+                    self._series[key] += 1
+            for suffix, amount in (('_sum', value), ('_count', 1)):
+                self._series[(name + suffix, _label_key(labels))] += amount
+        self._maybe_flush()
+
+    def _init_histogram(self, name, labels):
+        """Create every bucket of one histogram series at 0 (lock held)
+        
+        Prometheus expects all configured buckets, not only the ones an
+        observation has landed in.
+        """
+        for bound in METRICS[name][2] + (math.inf,):
+            self._series[(f'{name}_bucket', _label_key(dict(labels, le=_format_value(bound))))] = 0
+        self._series[(f'{name}_sum', _label_key(labels))] = 0
+        self._series[(f'{name}_count', _label_key(labels))] = 0
+
+    def gauge(self, name, func):
+        """Read a gauge from func() whenever this process flushes"""
+        with self._lock:
+            self._gauge_callbacks[name] = func
+
+    def flush(self):
+        """Write this process's series to the shared table"""
+        now = time.time()
+        with self._lock:
+            self._next_flush = time.monotonic() + self.flush_interval
+            rows = [(name, labels, value) for (name, labels), value in self._series.items()]
+            callbacks = list(self._gauge_callbacks.items())
+        for name, func in callbacks:
+            try:
+                rows.append((name, '', float(func())))
+            except Exception as e:
+                print(f"Error reading gauge {name}: {e}")
+
+        pid = os.getpid()
+        with self.db.transaction() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO metrics (pid, name, labels, value, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(pid, name, labels, value, now) for name, labels, value in rows]
+            )
+
+    def collect(self):
+        """Series summed over all workers, {(name, labels json): value}"""
+        self.flush()
+        gauge_cutoff = time.time() - 3 * self.flush_interval
+        totals = {}
+        for row in self.db.execute('SELECT name, labels, value, updated_at FROM metrics'):
+            # Histogram series (_bucket/_sum/_count) are never gauges
+            kind = METRICS.get(row['name'], (None,))[0]
+            if kind == 'gauge' and row['updated_at'] < gauge_cutoff:
+                continue
+            key = (row['name'], row['labels'])
+            totals[key] = totals.get(key, 0) + row['value']
+        return totals
+
+    def compact(self):
+        """Fold the series of exited processes into one row per series
+
+        Counters and histograms keep their totals under pid 0 and gauges
+        of exited processes are dropped, so the table doesn't grow with
+        every worker restart. Only meaningful on the host that owns the
+        database, where the pids can be checked.
+        """
+        pids = [row['pid'] for row in self.db.execute('SELECT DISTINCT pid FROM metrics WHERE pid != 0')]
+        dead = [pid for pid in pids if not pid_alive(pid)]
+        if not dead:
+            return 0
+        now = time.time()
+        marks = ','.join('?' * len(dead))
+        with self.db.transaction() as conn:
+            rows = conn.execute(
+                f'SELECT name, labels, SUM(value) AS value FROM metrics '
+                f'WHERE pid IN ({marks}) GROUP BY name, labels', dead
+            ).fetchall()
+            conn.executemany(
+                'INSERT INTO metrics (pid, name, labels, value, updated_at) VALUES (0, ?, ?, ?, ?) '
+                'ON CONFLICT(pid, name, labels) DO UPDATE SET value = value + excluded.value, '
+                'updated_at = excluded.updated_at',
+                [
+                    (row['name'], row['labels'], row['value'], now) for row in rows
+                    if METRICS.get(row['name'], (None,))[0] != 'gauge'
+                ]
+            )
+            conn.execute(f'DELETE FROM metrics WHERE pid IN ({marks})', dead)
+        return len(dead)
+
+    def value(self, totals, name, **labels):
+        """Sum of the series of one metric matching the given labels"""
+        total = 0
+        for (series, label_json), value in totals.items():
+            if series != name:
+                continue
+            series_labels = json.loads(label_json) if label_json else {}
+            if all(series_labels.get(k) == v for k, v in labels.items()):
+                total += value
+        return int(total) if float(total).is_integer() else total
+
+    def render(self):
+        """Prometheus text exposition format"""
+        totals = self.collect()
+        by_metric = {}
+        for (series, label_json), value in totals.items():
+            base = series
+            for suffix in ('_bucket', '_sum', '_count'):
+                if series.endswith(suffix) and series[:-len(suffix)] in METRICS:
+                    base = series[:-len(suffix)]
+            by_metric.setdefault(base, []).append((series, label_json, value))
+
+        lines = []
+        for name, (kind, help_text, _) in METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for series, label_json, value in sorted(by_metric.get(name, []), key=self._sort_key):
+                labels = json.loads(label_json) if label_json else {}
+                lines.append(f'{series}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _sort_key(entry):
+        series, label_json, _ = entry
+        labels = json.loads(label_json) if label_json else {}
+        le = labels.pop('le', None)
+        bound = math.inf if le in (None, '+Inf') else float(le)
+        return series.endswith('_count'), series.endswith('_sum'), sorted(labels.items()), bound
+
+    def _maybe_flush(self):
+        with self._lock:
+            if time.monotonic() < self._next_flush:
+                return
+            self._next_flush = time.monotonic() + self.flush_interval
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Error flushing metrics: {e}")
+
+
+# Process-wide registry, like the task store it is shared through SQLite
+metrics = MetricsRegistry()
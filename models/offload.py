@@ -0,0 +1,30 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+
+def gevent_patched():
+    """Whether this process runs under gevent's monkey patching
+
+    True in a gunicorn worker started with WORKER_CLASS=gevent.
+    """
+    if 'gevent' not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched('threading')
+
+
+def blocking_pool(max_workers, name):
+    """Executor for calls that hold the CPU or block outside gevent's reach
+
+    With the gthread worker this is a plain thread pool, which bounds how
+    many such calls a process runs at once. Under gevent, threads are
+    greenlets sharing one OS thread, so a yt-dlp extraction (regex and JS
+    work on large pages) would stall the event loop that serves progress,
+    health and file requests; gevent's executor runs the calls on real
+    threads and its futures wait cooperatively. Calls on this pool must
+    not submit to another blocking pool.
+    """
+    if gevent_patched():
+        from gevent.threadpool import ThreadPoolExecutor as NativeThreadPoolExecutor
+        return NativeThreadPoolExecutor(max_workers=max_workers)
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
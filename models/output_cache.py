@@ -0,0 +1,160 @@
+import os
+import time
+from models.db import Database
+from models.metrics import metrics
+
+
+class OutputCache:
+    """Finished downloads keyed by video ID, format and bitrate
+
+    The index lives in the shared SQLite database so every worker sees the
+    same entries. Total size is bounded with LRU eviction, and files that
+    are being served carry a reference count so they are never evicted
+    mid-transfer.
+    """
+
+    def __init__(self, storage, max_bytes=None, ref_lease_seconds=3600, db=None,
+                 meta_store=None, locations=None):
+        self.storage = storage
+        # Told about evicted files, like cleanup does for the files it removes
+        self.meta_store = meta_store
+        self.locations = locations
+        self.max_bytes = max_bytes or int(os.getenv('CACHE_MAX_MB', 5120)) * 1024 * 1024
+        # A reference older than this is assumed to belong to a dead worker
+        self.ref_lease_seconds = ref_lease_seconds
+        self.db = db or Database()
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS output_cache (
+                cache_key TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                refs INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_output_cache_last_access ON output_cache(last_access);
+            CREATE INDEX IF NOT EXISTS idx_output_cache_filename ON output_cache(filename);
+        ''')
+
+    def lookup(self, cache_key):
+        """Return the cached filename for a key, or None on a miss
+        
+        Every call counts as one cache request in the hit ratio, so a
+        request path looks a key up once and passes the result on.
+        """
+        row = self.db.execute(
+            'SELECT filename FROM output_cache WHERE cache_key = ?', (cache_key,)
+        ).fetchone()
+        if row is None:
+            metrics.inc('ytdl_cache_requests_total', cache='output', result='miss')
+            return None
+
+        if not self.storage.exists(row['filename']):
+            # Removed behind our back (cleanup, manual delete)
+            self.db.execute('DELETE FROM output_cache WHERE cache_key = ?', (cache_key,))
+            metrics.inc('ytdl_cache_requests_total', cache='output', result='miss')
+            return None
+
+        metrics.inc('ytdl_cache_requests_total', cache='output', result='hit')
+        self.db.execute(
+            'UPDATE output_cache SET last_access = ? WHERE cache_key = ?',
+            (time.time(), cache_key)
+        )
+        return row['filename']
+
+    def put(self, cache_key, filename):
+        """Record a finished file and evict old entries if over budget"""
+        size = self.storage.size(filename)
+        if size is None:
+            return
+        now = time.time()
+        self.db.execute(
+            'INSERT INTO output_cache (cache_key, filename, size, refs, created_at, last_access) '
+            'VALUES (?, ?, ?, 0, ?, ?) '
+            'ON CONFLICT(cache_key) DO UPDATE SET filename = excluded.filename, '
+            'size = excluded.size, last_access = excluded.last_access',
+            (cache_key, filename, size, now, now)
+        )
+        # The new file has not been fetched yet, never evict it right away
+        self.evict(keep=cache_key)
+
+    def acquire(self, filename):
+        """Pin a file while it is being served"""
+        self.db.execute(
+            'UPDATE output_cache SET refs = refs + 1, last_access = ? WHERE filename = ?',
+            (time.time(), filename)
+        )
+
+    def release(self, filename):
+        """Unpin a file once the transfer is over"""
+        self.db.execute(
+            'UPDATE output_cache SET refs = MAX(refs - 1, 0) WHERE filename = ?',
+            (filename,)
+        )
+
+    def touch(self, filename):
+        """Mark a file as recently used without pinning it"""
+        self.db.execute(
+            'UPDATE output_cache SET last_access = ? WHERE filename = ?',
+            (time.time(), filename)
+        )
+
+    def in_use(self, filename):
+        """Whether a file is pinned by a transfer that is still within its lease"""
+        row = self.db.execute(
+            'SELECT 1 FROM output_cache WHERE filename = ? AND refs > 0 AND last_access >= ?',
+            (filename, time.time() - self.ref_lease_seconds)
+        ).fetchone()
+        return row is not None
+
+    def forget(self, filename):
+        """Drop index entries for a file removed elsewhere"""
+        self.db.execute('DELETE FROM output_cache WHERE filename = ?', (filename,))
+
+    def evict(self, keep=None):
+        """Delete least recently used files until the cache fits max_bytes"""
+        evicted = []
+        with self.db.transaction() as conn:
+            total = conn.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM output_cache'
+            ).fetchone()[0]
+            if total <= self.max_bytes:
+                return evicted
+
+            lease_cutoff = time.time() - self.ref_lease_seconds
+            rows = conn.execute(
+                'SELECT cache_key, filename, size FROM output_cache '
+                'WHERE (refs = 0 OR last_access < ?) AND cache_key IS NOT ? ORDER BY last_access',
+                (lease_cutoff, keep)
+            )
+            for row in rows.fetchall():
+                if total <= self.max_bytes:
+                    break
+                conn.execute('DELETE FROM output_cache WHERE cache_key = ?', (row['cache_key'],))
+                total -= row['size']
+                evicted.append(row['filename'])
+
+        # Unlink outside the transaction to keep the write lock short
+        removed = []
+        for filename in evicted:
+            try:
+                if self.storage.remove(filename):
+                    print(f"Evicted cached file: {filename}")
+            except Exception as e:
+                print(f"Error evicting {filename}: {e}")
+                continue
+            removed.append(filename)
+
+        if removed:
+            if self.meta_store is not None:
+                self.meta_store.delete(removed)
+            if self.locations is not None:
+                self.locations.forget(removed)
+        return evicted
+
+    def stats(self):
+        """Entry count and total bytes held by the cache"""
+        row = self.db.execute(
+            'SELECT COUNT(*) AS entries, COALESCE(SUM(size), 0) AS bytes FROM output_cache'
+        ).fetchone()
+        return {'entries': row['entries'], 'bytes': row['bytes'], 'max_bytes': self.max_bytes}
@@ -0,0 +1,39 @@
+import threading
+
+
+class ProgressBroker:
+    """Wakes progress streams in this process when a task changes
+
+    Updates are only counted, not queued: a stream that wakes up reads the
+    latest state from the task store, so any number of updates between two
+    reads collapse into one event. Streams on other workers don't get woken
+    and fall back to re-reading the store on a timer.
+    """
+
+    def __init__(self):
+        self._versions = {}
+        self._cond = threading.Condition()
+
+    def notify(self, task_id):
+        """Signal that a task record changed"""
+        with self._cond:
+            self._versions[task_id] = self._versions.get(task_id, 0) + 1
+            self._cond.notify_all()
+
+    def version(self, task_id):
+        """Current change counter of a task"""
+        with self._cond:
+            return self._versions.get(task_id, 0)
+
+    def wait(self, task_id, seen_version, timeout):
+        """Block until the task changes past seen_version or timeout expires"""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: self._versions.get(task_id, 0) != seen_version, timeout
+            )
+            return self._versions.get(task_id, 0)
+
+    def discard(self, task_id):
+        """Forget a finished task"""
+        with self._cond:
+            self._versions.pop(task_id, None)
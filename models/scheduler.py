@@ -0,0 +1,100 @@
+import heapq
+import itertools
+import os
+import threading
+
+
+class QueueFullError(Exception):
+    """Raised when the download queue cannot take another job"""
+
+
+class JobScheduler:
+    """Fixed pool of download workers fed from a bounded priority queue
+
+    Jobs with a lower priority number run first, ties run in submission
+    order. Each format has its own concurrency limit so one kind of job
+    cannot occupy every worker.
+    """
+
+    def __init__(self, workers=None, max_queue=None, format_limits=None):
+        self.workers = workers or int(os.getenv('MAX_CONCURRENT_DOWNLOADS', 5))
+        self.max_queue = max_queue or int(os.getenv('DOWNLOAD_QUEUE_SIZE', 50))
+        default_limit = max(1, self.workers - 1)
+        self.format_limits = format_limits or {
+            'mp3': int(os.getenv('MAX_CONCURRENT_MP3', default_limit)),
+            'mp4': int(os.getenv('MAX_CONCURRENT_MP4', default_limit)),
+        }
+        self._queue = []
+        self._running = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker, name=f"download-worker-{i + 1}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, task_id, func, format_type, priority=0):
+        """Queue func() to run on the pool, returns the queue position"""
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                raise QueueFullError(f"Download queue is full ({self.max_queue} jobs)")
+            heapq.heappush(self._queue, (priority, next(self._seq), task_id, format_type, func))
+            self._cond.notify()
+            return self._position(task_id)
+
+    def position(self, task_id):
+        """1-based position of a queued task, or None if it is not queued here"""
+        with self._cond:
+            return self._position(task_id)
+
+    def stats(self):
+        """Current queue depth and running jobs per format"""
+        with self._cond:
+            return {
+                'queued': len(self._queue),
+                'running': dict(self._running),
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+            }
+
+    def _position(self, task_id):
+        for i, job in enumerate(sorted(self._queue)):
+            if job[2] == task_id:
+                return i + 1
+        return None
+
+    def _has_capacity(self, format_type):
+        limit = self.format_limits.get(format_type, self.workers)
+        return self._running.get(format_type, 0) < limit
+
+    def _take_next(self):
+        """Pop the best job whose format is under its limit (lock held)"""
+        for job in sorted(self._queue):
+            if self._has_capacity(job[3]):
+                self._queue.remove(job)
+                heapq.heapify(self._queue)
+                return job
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = self._take_next()
+                while job is None:
+                    self._cond.wait()
+                    job = self._take_next()
+                format_type = job[3]
+                self._running[format_type] = self._running.get(format_type, 0) + 1
+
+            try:
+                job[4]()
+            except Exception as e:
+                print(f"Download job {job[2]} crashed: {e}")
+            finally:
+                with self._cond:
+                    self._running[format_type] -= 1
+                    # A finished job may unblock a job of the same format
+                    self._cond.notify_all()
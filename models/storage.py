@@ -0,0 +1,155 @@
+import argparse
+import hashlib
+import os
+
+
+class Storage:
+    """Downloads folder split into hash-prefix subdirectories
+
+    A file lives at <root>/ab/cd/<filename>, where ab/cd are the first hex
+    digits of the SHA-1 of the filename up to its first dot. Every file
+    of one job (<id>-mp3-192.m4a, .part, .mp3, ...) shares that prefix, so
+    yt-dlp, ffmpeg and the transcode pool keep working inside a single
+    directory, and no directory grows with the number of cached files.
+
+    Files left in the root by earlier versions are still found until
+    migrate() (python -m models.storage migrate) moves them into place.
+    """
+
+    def __init__(self, root=None, depth=None):
+        self.root = root or os.path.join(os.getcwd(), 'static', 'downloads')
+        self.depth = depth if depth is not None else int(os.getenv('STORAGE_SHARD_DEPTH', 2))
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def valid_name(name):
+        """A plain filename that can't point outside its shard"""
+        return bool(name) and not name.startswith('.') and '/' not in name \
+            and '\\' not in name and '\x00' not in name
+
+    def shard(self, name):
+        """Relative directory of a file, e.g. '3f/a0'"""
+        digest = hashlib.sha1(name.split('.', 1)[0].encode('utf-8')).hexdigest()
+        return '/'.join(digest[i * 2:i * 2 + 2] for i in range(self.depth))
+
+    def relpath(self, name):
+        """Path of a file relative to the root, as used in URLs"""
+        if not self.valid_name(name):
+            raise ValueError(f'Invalid filename: {name!r}')
+        shard = self.shard(name)
+        return f'{shard}/{name}' if shard else name
+
+    def path(self, name):
+        """Absolute path a file is stored at"""
+        return os.path.join(self.root, *self.relpath(name).split('/'))
+
+    def prepare(self, name):
+        """Absolute path for a file about to be written, its shard created"""
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def locate(self, name):
+        """Path of an existing file, also in the old flat layout, or None"""
+        if not self.valid_name(name):
+            return None
+        for path in (self.path(name), os.path.join(self.root, name)):
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def exists(self, name):
+        return self.locate(name) is not None
+
+    def size(self, name):
+        """Size in bytes, or None when the file is missing"""
+        path = self.locate(name)
+        try:
+            return os.path.getsize(path) if path else None
+        except FileNotFoundError:
+            return None
+
+    def remove(self, name):
+        """Delete a file, returns False if it was already gone"""
+        path = self.locate(name)
+        if path is None:
+            return False
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def place(self, path):
+        """Move a file written elsewhere to its shard, returns the new path"""
+        target = self.prepare(os.path.basename(path))
+        if os.path.abspath(path) != target:
+            os.replace(path, target)
+        return target
+
+    def scan(self):
+        """Yield a DirEntry for every file, flat leftovers first
+
+        Directories are opened one at a time as the walk reaches them, so
+        the generator can be paused between cleanup ticks.
+        """
+        yield from self._scan_dir(self.root, self.depth)
+
+    def _scan_dir(self, path, depth):
+        try:
+            entries = os.scandir(path)
+        except FileNotFoundError:
+            return
+        subdirs = []
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_file(follow_symlinks=False):
+                        yield entry
+                    elif depth and entry.is_dir(follow_symlinks=False) and self._is_shard(entry.name):
+                        subdirs.append(entry.path)
+                except FileNotFoundError:
+                    continue
+        for subdir in sorted(subdirs):
+            yield from self._scan_dir(subdir, depth - 1)
+
+    @staticmethod
+    def _is_shard(name):
+        return len(name) == 2 and all(c in '0123456789abcdef' for c in name)
+
+    def migrate(self, dry_run=False):
+        """Move files of the flat layout into their shards
+
+        Safe to run while the app is serving: a file is visible at its old
+        path until the rename, and locate() looks at both. Returns the
+        number of files moved (or that would be moved).
+        """
+        moved = 0
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or not entry.is_file(follow_symlinks=False):
+                    continue
+                if not dry_run:
+                    try:
+                        self.place(entry.path)
+                    except FileNotFoundError:
+                        continue  # removed meanwhile
+                moved += 1
+        return moved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manage the sharded downloads folder')
+    parser.add_argument('command', choices=['migrate'])
+    parser.add_argument('--root', help='Downloads folder (default: ./static/downloads)')
+    parser.add_argument('--dry-run', action='store_true', help='Only count the files to move')
+    args = parser.parse_args(argv)
+
+    storage = Storage(args.root)
+    moved = storage.migrate(dry_run=args.dry_run)
+    verb = 'Would move' if args.dry_run else 'Moved'
+    print(f"{verb} {moved} files into {storage.depth}-level shards under {storage.root}")
+
+
+if __name__ == '__main__':
+    main()
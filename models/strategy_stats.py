@@ -0,0 +1,65 @@
+import threading
+from collections import deque
+
+
+class StrategyStats:
+    """Sliding window of outcomes for each extraction strategy
+
+    Used to try the strategy with the lowest expected time to a successful
+    extraction first. Without any history the configured order is kept,
+    and a strategy that keeps failing is still tried last so it can recover
+    once it starts working again. Stats are per process.
+    """
+
+    def __init__(self, count, window=50):
+        self.count = count
+        self._results = [deque(maxlen=window) for _ in range(count)]
+        self._lock = threading.Lock()
+
+    def record(self, index, success, latency):
+        """Record one attempt of strategy index"""
+        with self._lock:
+            self._results[index].append((success, latency))
+
+    def order(self):
+        """Strategy indexes, most promising first"""
+        with self._lock:
+            latencies = [latency for results in self._results for _, latency in results]
+            # An untried strategy is assumed to be a coin flip at typical latency
+            untried_cost = 2 * sum(latencies) / len(latencies) if latencies else 0.0
+            return sorted(
+                range(self.count),
+                key=lambda i: (self._expected_cost(i, untried_cost), i)
+            )
+
+    def snapshot(self):
+        """Success rate and mean latency per strategy"""
+        with self._lock:
+            return [
+                {
+                    'attempts': len(results),
+                    'success_rate': self._success_rate(results),
+                    'mean_latency': self._mean_latency(results),
+                }
+                for results in self._results
+            ]
+
+    def _expected_cost(self, index, untried_cost):
+        """Mean latency divided by success rate: expected time to a success"""
+        results = self._results[index]
+        if not results:
+            return untried_cost
+        # Laplace smoothing keeps a single failure from burying a strategy
+        successes = sum(1 for ok, _ in results if ok)
+        rate = (successes + 1) / (len(results) + 2)
+        return self._mean_latency(results) / rate
+
+    def _success_rate(self, results):
+        if not results:
+            return None
+        return sum(1 for ok, _ in results if ok) / len(results)
+
+    def _mean_latency(self, results):
+        if not results:
+            return None
+        return sum(latency for _, latency in results) / len(results)
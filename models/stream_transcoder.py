@@ -0,0 +1,136 @@
+import os
+import subprocess
+import threading
+import uuid
+from models.ydl_pool import YoutubeDLPool
+
+
+def select_audio_format(info):
+    """Best audio-only format of an extracted info dict, or None"""
+    formats = [
+        f for f in info.get('formats') or []
+        if f.get('url') and f.get('acodec') not in (None, 'none')
+        and f.get('vcodec') in (None, 'none')
+        and f.get('protocol', 'https') in ('http', 'https')
+    ]
+    if not formats:
+        return None
+    return max(formats, key=lambda f: (f.get('abr') or f.get('tbr') or 0))
+
+
+class StreamTranscoder:
+    """Encodes a remote audio stream to MP3 while it is still downloading
+
+    A feeder thread pulls the source in HTTP range chunks and writes it to
+    ffmpeg's stdin; the caller iterates the encoded MP3 from ffmpeg's
+    stdout. The same bytes are written to disk so the finished file can be
+    reused by later requests. The source is fetched with a pooled YoutubeDL,
+    so connections to the media hosts stay open from one stream to the next.
+    """
+
+    def __init__(self, ffmpeg_path=None, http_chunk_size=10 * 1024 * 1024, read_size=64 * 1024,
+                 ydl_pool=None):
+        self.ffmpeg_path = ffmpeg_path or os.getenv('FFMPEG_PATH', 'ffmpeg')
+        self.ydl_pool = ydl_pool or YoutubeDLPool()
+        # YouTube throttles long single requests, so fetch in chunks
+        self.http_chunk_size = http_chunk_size
+        self.read_size = read_size
+
+    def stream(self, source_url, headers, target_path, bitrate='192', on_complete=None):
+        """Generator of MP3 bytes, the file lands at target_path on success
+        
+        Every stream writes its own temporary file, so two streams of the
+        same video never write into one file; each publishes a complete
+        copy with an atomic replace.
+        """
+        part_path = f"{target_path}.{uuid.uuid4().hex[:12]}.part"
+        process = subprocess.Popen(
+            [
+                self.ffmpeg_path, '-loglevel', 'error',
+                '-i', 'pipe:0',
+                '-vn', '-codec:a', 'libmp3lame', '-b:a', f'{bitrate}k',
+                '-f', 'mp3', 'pipe:1',
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        feed_errors = []
+        feeder = threading.Thread(
+            target=self._feed,
+            args=(source_url, headers, process, feed_errors),
+            name='stream-feeder',
+            daemon=True
+        )
+        feeder.start()
+
+        completed = False
+        try:
+            with open(part_path, 'wb') as out:
+                while True:
+                    chunk = process.stdout.read1(self.read_size)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    yield chunk
+
+            process.wait()
+            feeder.join()
+            if feed_errors:
+                raise RuntimeError(f"Source download failed: {feed_errors[0]}")
+            if process.returncode != 0:
+                raise RuntimeError(f"ffmpeg exited with code {process.returncode}")
+
+            os.replace(part_path, target_path)
+            completed = True
+            if on_complete:
+                on_complete(target_path)
+        finally:
+            # Client went away or something failed: stop both ends
+            if not completed:
+                process.kill()
+                process.wait()
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+
+    def _feed(self, source_url, headers, process, errors):
+        """Copy the source into ffmpeg's stdin in range requests"""
+        from yt_dlp.networking import Request
+        from yt_dlp.networking.exceptions import HTTPError
+
+        try:
+            with self.ydl_pool.checkout('stream:source', {'quiet': True, 'no_warnings': True}) as ydl:
+                start = 0
+                while True:
+                    end = start + self.http_chunk_size - 1
+                    request = Request(source_url, headers=dict(headers, Range=f'bytes={start}-{end}'))
+                    try:
+                        response = ydl.urlopen(request)
+                    except HTTPError as e:
+                        if e.status == 416:  # size was an exact multiple of the chunk
+                            break
+                        raise
+
+                    received = 0
+                    with response:
+                        while True:
+                            data = response.read(self.read_size)
+                            if not data:
+                                break
+                            process.stdin.write(data)
+                            received += len(data)
+
+                    # A server that ignored Range sent everything at once
+                    if response.status != 206 or received < self.http_chunk_size:
+                        break
+                    start += received
+        except (BrokenPipeError, ValueError):
+            # ffmpeg was stopped because the client disconnected
+            pass
+        except Exception as e:
+            errors.append(e)
+        finally:
+            try:
+                process.stdin.close()
+            except Exception:
+                pass
@@ -0,0 +1,350 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, fields as dataclass_fields
+from models.db import Database
+
+
+# Statuses of a job that is still queued or running
+ACTIVE_STATUSES = (
+    'queued', 'starting', 'downloading', 'processing', 'transcoding', 'completed', 'retrying'
+)
+
+
+_UNSET = object()
+
+
+@dataclass(slots=True)
+class TaskRecord:
+    """Compact task record for the in-memory store
+
+    Fields every task has get a slot instead of a per-record dict; rarer
+    ones (batch items, cache flags) go to extra. Unset fields are left out
+    of as_dict() so callers see the same keys they stored.
+    """
+
+    status: object = _UNSET
+    progress: object = _UNSET
+    filename: object = _UNSET
+    error: object = _UNSET
+    format: object = _UNSET
+    quality: object = _UNSET
+    video_id: object = _UNSET
+    job_key: object = _UNSET
+    queue_position: object = _UNSET
+    plan: object = _UNSET
+    title: object = _UNSET
+    source_file: object = _UNSET
+    created_at: object = _UNSET
+    updated_at: float = 0.0
+    extra: dict = None
+
+    def set(self, fields):
+        for key, value in fields.items():
+            if key in _RECORD_SLOTS:
+                setattr(self, key, value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+
+    def as_dict(self):
+        data = {}
+        for name in _RECORD_SLOTS:
+            value = getattr(self, name)
+            if value is not _UNSET:
+                data[name] = value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+_RECORD_SLOTS = tuple(f.name for f in dataclass_fields(TaskRecord) if f.name != 'extra')
+
+
+def _task_limits(ttl_seconds, max_entries):
+    """TTL and entry cap from arguments or the TASK_TTL_SECONDS / TASK_MAX_ENTRIES env vars"""
+    ttl_seconds = ttl_seconds or float(os.getenv('TASK_TTL_SECONDS', 3600))
+    max_entries = max_entries or int(os.getenv('TASK_MAX_ENTRIES', 10000))
+    return ttl_seconds, max_entries
+
+
+class MemoryTaskStore:
+    """Task state kept in this process only (single worker setups)
+
+    Records are kept in order of their last update, so expiring the ones
+    idle for longer than ttl_seconds only looks at the oldest few, and
+    the oldest are dropped first once max_entries is reached. Expiry runs
+    as part of normal reads and writes. Records of queued and running jobs
+    are never dropped: they are moved behind the others instead, so a job
+    waiting in a long queue keeps answering progress polls.
+    """
+
+    shared = False
+
+    def __init__(self, ttl_seconds=None, max_entries=None):
+        self.ttl_seconds, self.max_entries = _task_limits(ttl_seconds, max_entries)
+        self._tasks = OrderedDict()
+        self._job_keys = {}
+        self._lock = threading.Lock()
+        self.expired_count = 0
+        self.evicted_count = 0
+
+    def claim(self, job_key, task_id, record):
+        """Create the task unless an active one has the same job key
+
+        Returns the id of the existing active task, or None if the new
+        record was stored.
+        """
+        with self._lock:
+            self._expire()
+            existing_id = self._job_keys.get(job_key)
+            existing = self._tasks.get(existing_id)
+            if existing and existing.status in ACTIVE_STATUSES:
+                return existing_id
+            self._store(task_id, dict(record, job_key=job_key))
+            self._job_keys[job_key] = task_id
+        return None
+
+    def create(self, task_id, record):
+        """Store a new task record"""
+        with self._lock:
+            self._expire()
+            self._store(task_id, record)
+
+    def get(self, task_id):
+        """Return a copy of the task record or None"""
+        with self._lock:
+            self._expire()
+            record = self._tasks.get(task_id)
+            return record.as_dict() if record is not None else None
+
+    def update(self, task_id, **fields):
+        """Merge fields into an existing task record"""
+        with self._lock:
+            record = self._tasks.get(task_id)
+            if record is None:
+                return False
+            record.set(fields)
+            record.updated_at = time.time()
+            self._tasks.move_to_end(task_id)
+            return True
+
+    def delete(self, task_id):
+        """Remove a task record"""
+        with self._lock:
+            self._forget(task_id)
+
+    def purge(self):
+        """Drop expired records now instead of on the next access"""
+        with self._lock:
+            before = self.expired_count
+            self._expire()
+            return self.expired_count - before
+
+    def stats(self):
+        """Entry count, limits and how many records were dropped"""
+        with self._lock:
+            return {
+                'entries': len(self._tasks),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'expired': self.expired_count,
+                'evicted': self.evicted_count,
+            }
+
+    def _store(self, task_id, fields):
+        """Insert or replace a record as the newest one (lock held)"""
+        self._forget(task_id)
+        record = TaskRecord()
+        record.set(fields)
+        record.updated_at = time.time()
+        self._tasks[task_id] = record
+        skipped = 0
+        while len(self._tasks) > self.max_entries and skipped < len(self._tasks):
+            task_id, record = next(iter(self._tasks.items()))
+            if record.status in ACTIVE_STATUSES:
+                self._tasks.move_to_end(task_id)
+                skipped += 1
+                continue
+            self._forget(task_id)
+            self.evicted_count += 1
+
+    def _expire(self):
+        """Drop records idle for longer than the TTL (lock held)"""
+        cutoff = time.time() - self.ttl_seconds
+        skipped = 0
+        while self._tasks and skipped < len(self._tasks):
+            task_id, record = next(iter(self._tasks.items()))
+            if record.updated_at >= cutoff:
+                break
+            if record.status in ACTIVE_STATUSES:
+                self._tasks.move_to_end(task_id)
+                skipped += 1
+                continue
+            self._forget(task_id)
+            self.expired_count += 1
+
+    def _forget(self, task_id):
+        """Drop a record and its job key index entry (lock held)"""
+        record = self._tasks.pop(task_id, None)
+        if record and self._job_keys.get(record.job_key) == task_id:
+            del self._job_keys[record.job_key]
+
+
+class SQLiteTaskStore:
+    """Task state in a WAL-mode SQLite file that every worker can see
+
+    Records idle for longer than ttl_seconds are hidden from reads and
+    deleted, together with the oldest records past max_entries, by a purge
+    that new tasks trigger at most once per purge_interval. Records of
+    queued and running jobs are exempt from both until the job ends.
+    """
+
+    shared = True
+
+    def __init__(self, path=None, ttl_seconds=None, max_entries=None, purge_interval=60):
+        self.ttl_seconds, self.max_entries = _task_limits(ttl_seconds, max_entries)
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        self._purge_lock = threading.Lock()
+        self.expired_count = 0
+        self.evicted_count = 0
+        self.db = Database(path)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_tasks_updated_at ON tasks(updated_at);
+            CREATE INDEX IF NOT EXISTS idx_tasks_job_key
+                ON tasks(json_extract(data, '$.job_key'));
+        ''')
+
+    def claim(self, job_key, task_id, record):
+        """Create the task unless an active one has the same job key
+
+        Returns the id of the existing active task, or None if the new
+        record was stored. The check and insert share one write
+        transaction so two workers cannot both start the same job.
+        """
+        self._maybe_purge()
+        now = time.time()
+        placeholders = ', '.join('?' for _ in ACTIVE_STATUSES)
+        with self.db.transaction() as conn:
+            row = conn.execute(
+                f"SELECT task_id FROM tasks WHERE json_extract(data, '$.job_key') = ? "
+                f"AND json_extract(data, '$.status') IN ({placeholders}) LIMIT 1",
+                (job_key, *ACTIVE_STATUSES)
+            ).fetchone()
+            if row:
+                return row['task_id']
+            conn.execute(
+                'INSERT OR REPLACE INTO tasks (task_id, data, updated_at) VALUES (?, ?, ?)',
+                (task_id, json.dumps(dict(record, job_key=job_key, updated_at=now)), now)
+            )
+        return None
+
+    def create(self, task_id, record):
+        """Store a new task record"""
+        self._maybe_purge()
+        now = time.time()
+        self.db.execute(
+            'INSERT OR REPLACE INTO tasks (task_id, data, updated_at) VALUES (?, ?, ?)',
+            (task_id, json.dumps(dict(record, updated_at=now)), now)
+        )
+
+    def get(self, task_id):
+        """Return the task record or None"""
+        row = self.db.execute(
+            'SELECT data FROM tasks WHERE task_id = ?', (task_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        record = json.loads(row['data'])
+        expired = record.get('updated_at', 0) < time.time() - self.ttl_seconds
+        if expired and record.get('status') not in ACTIVE_STATUSES:
+            return None
+        return record
+
+    def update(self, task_id, **fields):
+        """Merge fields into an existing task record in one statement"""
+        now = time.time()
+        fields['updated_at'] = now
+        paths = []
+        params = []
+        for key, value in fields.items():
+            paths.append('?, json(?)')
+            params.extend([f'$.{key}', json.dumps(value)])
+        cursor = self.db.execute(
+            f'UPDATE tasks SET data = json_set(data, {", ".join(paths)}), updated_at = ? '
+            'WHERE task_id = ?',
+            (*params, now, task_id)
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, task_id):
+        """Remove a task record"""
+        self.db.execute('DELETE FROM tasks WHERE task_id = ?', (task_id,))
+
+    def purge(self):
+        """Delete expired records and the oldest ones past max_entries
+        
+        Records of queued and running jobs are left alone.
+        """
+        placeholders = ', '.join('?' for _ in ACTIVE_STATUSES)
+        inactive = f"COALESCE(json_extract(data, '$.status'), '') NOT IN ({placeholders})"
+        cursor = self.db.execute(
+            f'DELETE FROM tasks WHERE updated_at < ? AND {inactive}',
+            (time.time() - self.ttl_seconds, *ACTIVE_STATUSES)
+        )
+        expired = cursor.rowcount
+        excess = self.db.execute('SELECT COUNT(*) FROM tasks').fetchone()[0] - self.max_entries
+        evicted = 0
+        if excess > 0:
+            cursor = self.db.execute(
+                f'DELETE FROM tasks WHERE task_id IN ('
+                f'SELECT task_id FROM tasks WHERE {inactive} ORDER BY updated_at LIMIT ?)',
+                (*ACTIVE_STATUSES, excess)
+            )
+            evicted = cursor.rowcount
+        self.expired_count += expired
+        self.evicted_count += evicted
+        return expired + evicted
+
+    def stats(self):
+        """Entry count, limits and how many records this process dropped"""
+        row = self.db.execute('SELECT COUNT(*) AS entries FROM tasks').fetchone()
+        return {
+            'entries': row['entries'],
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'expired': self.expired_count,
+            'evicted': self.evicted_count,
+        }
+
+    def _maybe_purge(self):
+        """Purge if purge_interval has passed since the last one"""
+        now = time.time()
+        if now < self._next_purge or not self._purge_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_purge = now + self.purge_interval
+            self.purge()
+        except Exception as e:
+            print(f"Error purging task records: {e}")
+        finally:
+            self._purge_lock.release()
+
+
+def create_task_store():
+    """Build the task store selected by the TASK_STORE env var"""
+    backend = os.getenv('TASK_STORE', 'sqlite').lower()
+    if backend == 'memory':
+        return MemoryTaskStore()
+    if backend == 'sqlite':
+        return SQLiteTaskStore()
+    raise ValueError(f"Unknown TASK_STORE backend: {backend}")
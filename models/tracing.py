@@ -0,0 +1,111 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class TaskTrace:
+    """Timing spans of one task
+
+    Each span is {'name', 'start', 'duration'} with start in seconds after
+    the task was created; a span still running has duration None. The
+    list is small and JSON serializable so it can live on the task record.
+    """
+
+    def __init__(self, origin=None, spans=None):
+        self.origin = origin or time.time()
+        self.spans = list(spans or [])
+
+    def start(self, name):
+        """Open a span, closing an earlier open span of the same name"""
+        self.end(name)
+        self.spans.append({
+            'name': name,
+            'start': round(time.time() - self.origin, 3),
+            'duration': None
+        })
+
+    def end(self, name):
+        """Close the open span of that name, returns False if none was open"""
+        for span in reversed(self.spans):
+            if span['name'] == name and span['duration'] is None:
+                span['duration'] = round(time.time() - self.origin - span['start'], 3)
+                return True
+        return False
+
+    def switch(self, from_name, to_name):
+        """Close one stage and open the next"""
+        self.end(from_name)
+        self.start(to_name)
+
+    def is_open(self, name):
+        return any(s['name'] == name and s['duration'] is None for s in self.spans)
+
+    def add(self, name, started, duration):
+        """Record a span measured elsewhere (wall-clock start)"""
+        self.spans.append({
+            'name': name,
+            'start': round(started - self.origin, 3),
+            'duration': round(duration, 3)
+        })
+
+    def close_all(self):
+        """Close whatever is still open, e.g. when the task fails"""
+        for span in self.spans:
+            if span['duration'] is None:
+                span['duration'] = round(time.time() - self.origin - span['start'], 3)
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack at a fixed interval
+
+    Cheap enough to leave on for a fraction of tasks: a helper thread looks
+    at sys._current_frames() every interval seconds and counts the stacks
+    it sees. The result is written in the folded format that flamegraph
+    tools read, one "frame;frame;frame count" line per stack.
+    """
+
+    def __init__(self, thread_id=None, interval=0.01, max_depth=64):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='task-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def top(self, limit=10):
+        """Innermost frames with the most samples"""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return leaves.most_common(limit)
+
+    def write_folded(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
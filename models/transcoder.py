@@ -0,0 +1,72 @@
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from models.metrics import metrics
+
+
+def default_workers():
+    """This process's share of the host's CPUs, at least one
+    
+    Every gunicorn worker runs its own pool, so the cores are split
+    between the WEB_CONCURRENCY processes rather than given to each.
+    """
+    processes = max(1, int(os.getenv('WEB_CONCURRENCY', 1)))
+    return max(1, (os.cpu_count() or 1) // processes)
+
+
+class TranscodePool:
+    """Runs ffmpeg encodes on their own pool, sized to this process's CPU share
+
+    Every job is a separate ffmpeg process, so the pool threads only wait on
+    subprocesses and the encodes themselves spread across the cores while
+    the download workers keep fetching. At most workers + max_queue encodes
+    are held at once; past that submit() waits, which slows the download
+    workers down instead of piling fetched sources up on disk.
+    """
+
+    def __init__(self, workers=None, max_queue=None, ffmpeg_path=None):
+        self.workers = workers or int(os.getenv('TRANSCODE_WORKERS', 0)) or default_workers()
+        self.max_queue = max_queue or int(os.getenv('TRANSCODE_QUEUE_SIZE', self.workers * 4))
+        self.ffmpeg_path = ffmpeg_path or os.getenv('FFMPEG_PATH', 'ffmpeg')
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix='transcode'
+        )
+
+    def submit(self, source_path, target_path, bitrate='192'):
+        """Queue an MP3 encode of source_path, returns a Future
+        
+        Blocks while the pool is full.
+        """
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._encode_mp3, source_path, target_path, bitrate)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def _encode_mp3(self, source_path, target_path, bitrate):
+        """Encode to a temporary name, then swap it in and drop the source"""
+        temp_path = f"{target_path}.encoding"
+        command = [
+            self.ffmpeg_path, '-y', '-nostdin', '-loglevel', 'error',
+            '-i', source_path,
+            '-vn', '-codec:a', 'libmp3lame', '-b:a', f'{bitrate}k',
+            '-f', 'mp3', temp_path,
+        ]
+        started = time.monotonic()
+        try:
+            result = subprocess.run(command, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()[-500:]}")
+            os.replace(temp_path, target_path)
+            metrics.observe('ytdl_transcode_seconds', time.monotonic() - started)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        os.remove(source_path)
+        return target_path
@@ -0,0 +1,162 @@
+import os
+import threading
+from contextlib import contextmanager
+
+# Open connections one YoutubeDL instance may hold to the same host
+CONNECTIONS_PER_HOST = int(os.getenv('YDL_CONNECTIONS_PER_HOST', 4))
+
+# yt-dlp is imported on first use (or by preload() in the gunicorn
+# master), so importing the app stays cheap
+_loaded = threading.Lock()
+_keepalive = None
+
+
+def load_ytdlp():
+    """Import yt-dlp and register the keep-alive handler, once per process"""
+    global _keepalive
+    with _loaded:
+        if _keepalive is None:
+            _keepalive = _register_keepalive()
+    import yt_dlp
+    return yt_dlp
+
+
+def preload():
+    """Load yt-dlp and the YouTube extractor ahead of the first request
+
+    Called in the gunicorn master, forked workers share the loaded code.
+    """
+    yt_dlp = load_ytdlp()
+    ydl = yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True})
+    ydl.get_info_extractor('Youtube')
+    ydl.close()
+
+
+def _register_keepalive():
+    try:
+        from yt_dlp.networking._requests import RequestsRH
+        from yt_dlp.networking.common import register_preference, register_rh
+    except ImportError:
+        # Without the requests package yt-dlp falls back to urllib, which
+        # opens a new connection for every request
+        return False
+
+    @register_rh
+    class KeepAliveRequestsRH(RequestsRH):
+        """yt-dlp's requests handler with a bounded keep-alive pool per host
+
+        The session lives as long as its YoutubeDL, so with pooled instances
+        connections to YouTube and the media hosts stay open from one task
+        to the next. A request beyond CONNECTIONS_PER_HOST waits for one of
+        the instance's connections to that host to be released.
+        """
+        RH_NAME = 'requests-keepalive'
+
+        def _create_instance(self, cookiejar, legacy_ssl_support=None):
+            session = super()._create_instance(cookiejar, legacy_ssl_support)
+            # http:// and https:// share one adapter
+            session.get_adapter('https://').init_poolmanager(
+                10, CONNECTIONS_PER_HOST, block=True
+            )
+            return session
+
+    @register_preference(KeepAliveRequestsRH)
+    def keepalive_preference(rh, request):
+        return 50
+
+    return True
+
+
+class _Pooled:
+    """One YoutubeDL and the hooks of the task currently using it"""
+
+    def __init__(self, params):
+        self.hooks = {}
+        self.uses = 0
+        self.ydl = load_ytdlp().YoutubeDL(params)
+        # Registered once; each task plugs its own callbacks in at checkout
+        self.ydl.add_progress_hook(lambda d: self._dispatch('progress', d))
+        self.ydl.add_postprocessor_hook(lambda d: self._dispatch('postprocessor', d))
+        self.ydl.add_post_hook(lambda path: self._dispatch('post', path))
+
+    def _dispatch(self, name, arg):
+        hook = self.hooks.get(name)
+        if hook is not None:
+            hook(arg)
+
+
+class YoutubeDLPool:
+    """Long-lived YoutubeDL instances, each used by one task at a time
+
+    Building a YoutubeDL sets up extractors and postprocessors and starts
+    with an empty HTTP session and cookie jar. A pooled instance keeps all
+    of that, so later tasks skip the setup and reuse open connections.
+    Instances are grouped by a key naming their option set (an extraction
+    strategy, a download profile); per task only the output template, the
+    format and the progress/post/postprocessor hooks change. An instance
+    whose task raised is closed instead of reused, and each one is
+    replaced after max_uses tasks.
+    """
+
+    def __init__(self, max_idle=None, max_uses=None):
+        # Idle instances kept per key; busy ones are not limited here
+        self.max_idle = max_idle or int(os.getenv('YDL_POOL_SIZE', 4))
+        self.max_uses = max_uses or int(os.getenv('YDL_MAX_USES', 200))
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._created = 0
+        self._reused = 0
+
+    @contextmanager
+    def checkout(self, key, params, outtmpl=None, format=None, hooks=None):
+        """Borrow an instance built from params, returned when the block ends
+
+        params must be the same for every checkout of a key.
+        """
+        with self._lock:
+            idle = self._idle.get(key)
+            pooled = idle.pop() if idle else None
+            if pooled is not None:
+                self._reused += 1
+        if pooled is None:
+            pooled = _Pooled(params)
+            with self._lock:
+                self._created += 1
+
+        ydl = pooled.ydl
+        if outtmpl is not None:
+            ydl.params['outtmpl']['default'] = outtmpl
+        if format is not None and format != ydl.params.get('format'):
+            ydl.params['format'] = format
+            ydl.format_selector = ydl.build_format_selector(format)
+        pooled.hooks = hooks or {}
+
+        reusable = False
+        try:
+            yield ydl
+            reusable = True
+        finally:
+            pooled.hooks = {}
+            pooled.uses += 1
+            self._give_back(key, pooled, reusable and pooled.uses < self.max_uses)
+
+    def _give_back(self, key, pooled, reusable):
+        if reusable:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.max_idle:
+                    idle.append(pooled)
+                    return
+        try:
+            pooled.ydl.close()
+        except Exception as e:
+            print(f"Error closing YoutubeDL instance: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'created': self._created,
+                'reused': self._reused,
+                'idle': sum(len(idle) for idle in self._idle.values()),
+                'connections_per_host': CONNECTIONS_PER_HOST if _keepalive else None,
+            }
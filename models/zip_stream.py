@@ -0,0 +1,68 @@
+import io
+import os
+import zipfile
+
+
+class _ZipBuffer(io.RawIOBase):
+    """Write-only, unseekable sink that zipfile writes into
+
+    zipfile falls back to data descriptors when it can't seek, so each
+    member can be written in one pass and the buffer drained as we go.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(files, chunk_size=1024 * 1024, on_open=None, on_close=None):
+    """Yield a ZIP archive of (path, arcname) pairs as it is built
+
+    Members are stored uncompressed since MP3/MP4 don't compress, and
+    nothing larger than one chunk is held in memory. on_open/on_close are
+    called with each path around its read, e.g. to pin it in the cache.
+    """
+    buffer = _ZipBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for path, arcname in files:
+            if not os.path.isfile(path):
+                continue
+            if on_open:
+                on_open(path)
+            try:
+                with open(path, 'rb') as source, \
+                        archive.open(arcname, 'w', force_zip64=True) as member:
+                    while True:
+                        data = source.read(chunk_size)
+                        if not data:
+                            break
+                        member.write(data)
+                        yield from _pending(buffer)
+            finally:
+                if on_close:
+                    on_close(path)
+            yield from _pending(buffer)
+    yield from _pending(buffer)
+
+
+def _pending(buffer):
+    """Drained bytes, skipping empty chunks that could end a chunked body"""
+    data = buffer.drain()
+    if data:
+        yield data
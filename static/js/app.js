@@ -3,6 +3,7 @@ class YouTubeDownloader {
     constructor() {
         this.currentTaskId = null;
         this.progressInterval = null;
+        this.progressSource = null;
         this.init();
     }
 
@@ -207,33 +208,71 @@ class YouTubeDownloader {
     }
 
     startProgressPolling() {
+        // Prefer server-pushed updates, poll only without SSE support
+        if (window.EventSource) {
+            this.startProgressStream();
+        } else {
+            this.startIntervalPolling();
+        }
+    }
+
+    startProgressStream() {
+        const source = new EventSource(`/api/progress/${this.currentTaskId}/stream`);
+        this.progressSource = source;
+
+        source.onmessage = (event) => {
+            this.handleProgressData(JSON.parse(event.data));
+        };
+
+        source.onerror = () => {
+            // Stream dropped (proxy timeout, server limit): keep going by polling
+            this.stopProgressUpdates();
+            if (this.currentTaskId) {
+                this.startIntervalPolling();
+            }
+        };
+    }
+
+    startIntervalPolling() {
         this.progressInterval = setInterval(() => {
             this.checkProgress();
         }, 1000);
     }
 
+    stopProgressUpdates() {
+        if (this.progressSource) {
+            this.progressSource.close();
+            this.progressSource = null;
+        }
+        clearInterval(this.progressInterval);
+        this.progressInterval = null;
+    }
+
     async checkProgress() {
         if (!this.currentTaskId) return;
 
         try {
             const response = await fetch(`/api/progress/${this.currentTaskId}`);
             const data = await response.json();
-
-            if (data.success) {
-                const progress = data.progress;
-                this.updateProgress(progress);
-
-                if (progress.status === 'finished') {
-                    this.onDownloadComplete(progress.filename);
-                } else if (progress.status === 'error') {
-                    this.onDownloadError(progress.error);
-                }
-            }
+            this.handleProgressData(data);
         } catch (error) {
             console.error('Failed to check progress:', error);
         }
     }
 
+    handleProgressData(data) {
+        if (!data.success) return;
+
+        const progress = data.progress;
+        this.updateProgress(progress);
+
+        if (progress.status === 'finished') {
+            this.onDownloadComplete(progress.filename);
+        } else if (progress.status === 'error') {
+            this.onDownloadError(progress.error);
+        }
+    }
+
     updateProgress(progress) {
         const progressBar = document.getElementById('progressBar');
         const progressPercent = document.getElementById('progressPercent');
@@ -246,6 +285,11 @@ class YouTubeDownloader {
         // Update status text
         let statusText = 'Processing...';
         switch (progress.status) {
+            case 'queued':
+                statusText = progress.queue_position
+                    ? `Waiting in queue (position ${progress.queue_position})...`
+                    : 'Waiting in queue...';
+                break;
             case 'starting':
                 statusText = 'Initializing download...';
                 break;
@@ -266,14 +310,16 @@ class YouTubeDownloader {
     }
 
     onDownloadComplete(filename) {
-        clearInterval(this.progressInterval);
+        this.stopProgressUpdates();
+        this.currentTaskId = null;
         
         // Show download link
         const downloadLink = document.getElementById('downloadLink');
         const fileLink = document.getElementById('fileDownloadLink');
         
-        fileLink.href = `/api/file/${filename}`;
-        fileLink.download = filename;
+        fileLink.href = `/api/file/${encodeURIComponent(filename)}`;
+        // Empty: the server names the file after the video title
+        fileLink.download = '';
         downloadLink.classList.remove('hidden');
 
         // Show ad before allowing download
@@ -286,7 +332,8 @@ class YouTubeDownloader {
     }
 
     onDownloadError(error) {
-        clearInterval(this.progressInterval);
+        this.stopProgressUpdates();
+        this.currentTaskId = null;
         this.showError(`Download failed: ${error}`);
         this.resetButton();
     }
@@ -0,0 +1,9 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def state_db(tmp_path, monkeypatch):
+    """Path of a fresh state database, also the default for new Databases"""
+    path = str(tmp_path / 'state.db')
+    monkeypatch.setenv('STATE_DB_PATH', path)
+    return path
@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+
+from models.db import Database
+from models.job_journal import JobJournal
+
+
+def journal(state_db, **kwargs):
+    """A journal as one worker process would open it"""
+    kwargs.setdefault('heartbeat_interval', 3600)
+    return JobJournal(Database(state_db), node_id='node-a', **kwargs)
+
+
+def test_owner_does_not_see_its_own_jobs_as_orphaned(state_db):
+    owner = journal(state_db)
+    owner.enqueue('download_1', 'https://youtu.be/dQw4w9WgXcQ', 'mp3')
+
+    assert owner.orphaned() == []
+    # Another worker on the node leaves it alone while the owner's pid is
+    # alive and the lease runs
+    other = journal(state_db)
+    other.pid = os.getppid()
+    assert other.orphaned() == []
+
+
+def test_restarted_worker_with_the_same_pid_adopts_jobs_of_the_dead_one_once(state_db):
+    # A restarted container keeps its node id and hands out the same pids,
+    # only the token tells the new workers from the dead one
+    dead = journal(state_db)
+    dead.enqueue('download_1', 'https://youtu.be/dQw4w9WgXcQ', 'mp3')
+    dead.start('download_1')
+    workers = [journal(state_db) for _ in range(2)]
+    assert all(worker.pid == dead.pid for worker in workers)
+
+    barrier = threading.Barrier(len(workers))
+    adopted = [None] * len(workers)
+
+    def adopt(i):
+        jobs = workers[i].orphaned()
+        assert [job['task_id'] for job in jobs] == ['download_1']
+        barrier.wait()
+        adopted[i] = workers[i].adopt(jobs[0])
+
+    threads = [threading.Thread(target=adopt, args=(i,)) for i in range(len(workers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(adopted) == [False, True]
+    winner = workers[adopted.index(True)]
+    job = winner.get('download_1')
+    assert job['owner_token'] == winner.token
+    assert job['state'] == 'queued'
+    assert winner.orphaned() == []
+
+
+def test_heartbeat_only_refreshes_jobs_of_its_own_token(state_db):
+    dead = journal(state_db)
+    dead.enqueue('download_old', 'https://youtu.be/dQw4w9WgXcQ', 'mp3')
+    stale = dead.get('download_old')['heartbeat_at']
+
+    live = journal(state_db, heartbeat_interval=0.02)
+    live.enqueue('download_new', 'https://youtu.be/9bZkp7q19f0', 'mp3')
+    fresh = live.get('download_new')['heartbeat_at']
+    time.sleep(0.1)
+
+    assert live.get('download_old')['heartbeat_at'] == stale
+    assert live.get('download_new')['heartbeat_at'] > fresh
+
+
+def test_owner_on_another_node_keeps_its_jobs_until_the_lease_runs_out(state_db):
+    owner = JobJournal(Database(state_db), node_id='node-b', heartbeat_interval=3600,
+                       lease_seconds=0.05)
+    owner.enqueue('download_1', 'https://youtu.be/dQw4w9WgXcQ', 'mp3')
+    other = journal(state_db, lease_seconds=0.05)
+
+    assert other.orphaned() == []
+    time.sleep(0.1)
+    assert [job['task_id'] for job in other.orphaned()] == ['download_1']
@@ -0,0 +1,47 @@
+from models.db import Database
+from models.meta_store import MetaStore
+
+
+def totals_by_scan(db):
+    row = db.execute(
+        'SELECT COUNT(*) AS total_files, COALESCE(SUM(downloaded), 0) AS downloaded_files, '
+        'COALESCE(SUM(download_count), 0) AS total_downloads FROM downloads'
+    ).fetchone()
+    return dict(row)
+
+
+def test_totals_follow_every_change(state_db):
+    db = Database(state_db)
+    meta = MetaStore(db)
+    for name in ('a.mp3', 'b.mp3', 'c.mp4'):
+        meta.register(name, f'download_{name}')
+    meta.register('a.mp3', None)  # produced again
+    meta.record_download('a.mp3')
+    meta.record_download('a.mp3')
+    meta.record_download('b.mp3')
+    meta.delete(['b.mp3', 'missing.mp3'])
+
+    assert meta.stats() == {'total_files': 2, 'downloaded_files': 1, 'total_downloads': 2}
+    assert meta.stats() == totals_by_scan(db)
+
+
+def test_totals_of_an_existing_database_are_counted_once(state_db):
+    db = Database(state_db)
+    meta = MetaStore(db)
+    meta.register('a.mp3', 'download_1')
+    meta.record_download('a.mp3')
+    # A database from before the totals table
+    db.executescript('''
+        DROP TRIGGER downloads_totals_insert;
+        DROP TRIGGER downloads_totals_update;
+        DROP TRIGGER downloads_totals_delete;
+        DROP TABLE download_totals;
+    ''')
+    db.execute("INSERT INTO downloads (filename, created_at) VALUES ('b.mp3', 0)")
+
+    # Every worker opens the store; only the first one counts the table
+    for _ in range(2):
+        meta = MetaStore(Database(state_db))
+    meta.register('c.mp3', 'download_3')
+
+    assert meta.stats() == {'total_files': 3, 'downloaded_files': 1, 'total_downloads': 1}
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+from models.scheduler import JobScheduler, QueueFullError
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError('condition not met in time')
+        time.sleep(0.01)
+
+
+def blocking_job(started, release, name):
+    def run():
+        started.append(name)
+        release.wait(5)
+    return run
+
+
+def test_lower_priority_number_runs_first_ties_in_submission_order():
+    scheduler = JobScheduler(workers=1, max_queue=10, format_limits={'mp3': 1})
+    release = threading.Event()
+    started = []
+    scheduler.submit('busy', blocking_job(started, release, 'busy'), 'mp3')
+    wait_until(lambda: started == ['busy'])
+
+    ran = []
+    for name, priority in (('batch', 1), ('single', 0), ('late', 5), ('single2', 0)):
+        scheduler.submit(name, lambda name=name: ran.append(name), 'mp3', priority=priority)
+    assert scheduler.position('single') == 1
+    assert scheduler.position('late') == 4
+
+    release.set()
+    wait_until(lambda: len(ran) == 4)
+    assert ran == ['single', 'single2', 'batch', 'late']
+
+
+def test_format_limit_leaves_workers_to_other_formats():
+    scheduler = JobScheduler(workers=3, max_queue=10, format_limits={'mp3': 1, 'mp4': 2})
+    release = threading.Event()
+    started = []
+    for i in range(3):
+        scheduler.submit(f'mp3-{i}', blocking_job(started, release, f'mp3-{i}'), 'mp3')
+    scheduler.submit('mp4-0', blocking_job(started, release, 'mp4-0'), 'mp4')
+
+    # The queued mp3 jobs don't hold back the mp4 job behind them
+    wait_until(lambda: len(started) == 2)
+    time.sleep(0.1)
+    stats = scheduler.stats()
+    assert sorted(started) == ['mp3-0', 'mp4-0']
+    assert stats['running'] == {'mp3': 1, 'mp4': 1}
+    assert stats['queued'] == 2
+
+    release.set()
+    wait_until(lambda: len(started) == 4)
+    wait_until(lambda: scheduler.stats()['running'] == {'mp3': 0, 'mp4': 0})
+
+
+def test_submit_past_max_queue_raises():
+    scheduler = JobScheduler(workers=1, max_queue=1, format_limits={'mp3': 1})
+    release = threading.Event()
+    started = []
+    scheduler.submit('busy', blocking_job(started, release, 'busy'), 'mp3')
+    wait_until(lambda: started == ['busy'])
+    scheduler.submit('queued', lambda: None, 'mp3')
+
+    with pytest.raises(QueueFullError):
+        scheduler.submit('overflow', lambda: None, 'mp3')
+    release.set()
@@ -0,0 +1,103 @@
+import threading
+import time
+
+from models.task_store import MemoryTaskStore, SQLiteTaskStore
+
+
+def test_sqlite_store_is_shared_between_workers(state_db):
+    # Each gunicorn worker opens its own store on the same file
+    first = SQLiteTaskStore(state_db)
+    second = SQLiteTaskStore(state_db)
+    first.create('download_1', {'status': 'queued', 'progress': 0})
+
+    assert second.update('download_1', status='downloading', progress=40)
+    record = first.get('download_1')
+    assert record['status'] == 'downloading'
+    assert record['progress'] == 40
+
+
+def test_update_of_unknown_task_reports_nothing_changed(state_db):
+    for store in (MemoryTaskStore(), SQLiteTaskStore(state_db)):
+        assert store.update('download_missing', status='finished') is False
+        assert store.get('download_missing') is None
+
+
+def _claim_concurrently(stores, job_key):
+    """Claim one job key from every store at once, returns the results"""
+    barrier = threading.Barrier(len(stores))
+    results = [None] * len(stores)
+
+    def claim(i):
+        barrier.wait()
+        results[i] = stores[i].claim(job_key, f'download_{i}', {'status': 'queued'})
+
+    threads = [threading.Thread(target=claim, args=(i,)) for i in range(len(stores))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_sqlite_claims_start_one_job(state_db):
+    stores = [SQLiteTaskStore(state_db) for _ in range(2)]
+    for round_ in range(20):
+        job_key = f'video{round_}:mp3:192'
+        results = _claim_concurrently(stores, job_key)
+
+        # One claim stores its task, the other gets that task's id back
+        winners = [i for i, result in enumerate(results) if result is None]
+        assert len(winners) == 1
+        assert results == [None if i in winners else f'download_{winners[0]}' for i in range(2)]
+
+
+def test_concurrent_memory_claims_start_one_job():
+    store = MemoryTaskStore()
+    results = _claim_concurrently([store, store], 'video:mp3:192')
+    assert results.count(None) == 1
+
+
+def test_claim_after_the_job_ended_starts_a_new_one(state_db):
+    for store in (MemoryTaskStore(), SQLiteTaskStore(state_db)):
+        assert store.claim('video:mp3:192', 'download_1', {'status': 'queued'}) is None
+        assert store.claim('video:mp3:192', 'download_2', {'status': 'queued'}) == 'download_1'
+        store.update('download_1', status='finished')
+        assert store.claim('video:mp3:192', 'download_3', {'status': 'queued'}) is None
+
+
+def make_stores(state_db, **limits):
+    # purge_interval=0 makes every new task trigger the SQLite purge, like
+    # every access does for the memory store
+    return [MemoryTaskStore(**limits), SQLiteTaskStore(state_db, purge_interval=0, **limits)]
+
+
+def test_active_records_outlive_the_ttl(state_db):
+    for store in make_stores(state_db, ttl_seconds=0.05):
+        store.create('download_active', {'status': 'downloading'})
+        store.create('download_done', {'status': 'finished'})
+        time.sleep(0.1)
+        store.purge()
+
+        assert store.get('download_active')['status'] == 'downloading'
+        assert store.get('download_done') is None
+
+        # Once the job ends its record expires like any other
+        store.update('download_active', status='finished')
+        time.sleep(0.1)
+        store.purge()
+        assert store.get('download_active') is None
+
+
+def test_active_records_are_not_evicted_past_max_entries(state_db):
+    for store in make_stores(state_db, max_entries=2):
+        store.create('download_active', {'status': 'queued'})
+        for i in range(4):
+            store.create(f'download_done_{i}', {'status': 'error'})
+            time.sleep(0.001)
+        store.purge()
+
+        # The oldest record is active and stays, the oldest finished ones go
+        assert store.get('download_active') is not None
+        assert store.get('download_done_0') is None
+        assert store.get('download_done_3') is not None
+        assert store.stats()['entries'] == 2